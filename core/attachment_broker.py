@@ -0,0 +1,79 @@
+# 附件中转
+import asyncio
+import os
+
+from astrbot.api import logger
+
+
+class AttachmentBroker:
+    """单条消息的附件中转
+
+    同一个 URL 只下载一次, 本地文件由转发通道 (上传) 和归档通道 (硬链接导入) 共用,
+    所有通道处理完后调用 cleanup() 统一删除临时文件。
+    download_func(url, file_name, max_bytes, expected_size, probe) 返回本地路径,
+    失败或超限返回 None。
+    """
+
+    def __init__(self, download_func, max_bytes: int):
+        self.download_func = download_func
+        self.max_bytes = max(1, int(max_bytes))
+        self._downloads: dict[str, asyncio.Task] = {}
+
+    def prefetch(
+        self,
+        url: str,
+        file_name: str,
+        expected_size: int | None = None,
+        probe: bool = False,
+    ) -> asyncio.Task | None:
+        """在后台开始下载, 同一 URL 只会发起一次"""
+        if not url:
+            return None
+        task = self._downloads.get(url)
+        if task is None:
+            task = asyncio.create_task(
+                self.download_func(url, file_name, self.max_bytes, expected_size, probe)
+            )
+            self._downloads[url] = task
+        return task
+
+    async def fetch(
+        self,
+        url: str,
+        file_name: str,
+        expected_size: int | None = None,
+        probe: bool = False,
+    ) -> str | None:
+        """返回 URL 对应的本地文件路径, 并发请求同一 URL 时共享一次下载"""
+        task = self.prefetch(url, file_name, expected_size, probe)
+        if task is None:
+            return None
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning(f"[QQ2TG] 附件下载失败: {exc}")
+            return None
+
+    @staticmethod
+    def fits(path: str | None, max_bytes: int) -> bool:
+        """本地文件存在且不超过该通道的大小上限"""
+        try:
+            return bool(path) and 0 < os.path.getsize(path) <= max_bytes
+        except OSError:
+            return False
+
+    async def cleanup(self):
+        tasks = list(self._downloads.values())
+        self._downloads.clear()
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for path in results:
+            if isinstance(path, str):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
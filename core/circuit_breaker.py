@@ -0,0 +1,101 @@
+# 转发目标熔断
+import time
+
+
+class CircuitBreaker:
+    """单个转发目标的熔断器
+
+    连续失败达到 failure_threshold 次后进入 open 状态并快速失败;
+    经过 recovery_seconds 后进入 half_open, 只放行一次探测请求,
+    探测成功则恢复 closed, 失败则重新 open。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 60.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_seconds = max(1.0, float(recovery_seconds))
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = ""
+        self._state = self.CLOSED
+        self._probe_inflight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.retry_in() <= 0:
+            self._state = self.HALF_OPEN
+            self._probe_inflight = False
+        return self._state
+
+    def retry_in(self) -> float:
+        """距离下一次允许探测的秒数"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.recovery_seconds - time.time())
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """探测请求既未成功也未失败 (如被平台限流或被取消) 时释放名额, 允许下一次探测"""
+        self._probe_inflight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.last_error = ""
+        self._state = self.CLOSED
+        self._probe_inflight = False
+
+    def record_failure(self, error: str = ""):
+        self.failures += 1
+        self.last_error = str(error)[:200]
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._state = self.OPEN
+            self.opened_at = time.time()
+            self._probe_inflight = False
+
+
+class TargetCircuitBreakers:
+    """按目标会话 (unified_msg_origin) 维护熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, target_umo: str) -> CircuitBreaker:
+        breaker = self._breakers.get(target_umo)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.recovery_seconds)
+            self._breakers[target_umo] = breaker
+        return breaker
+
+    def allow_request(self, target_umo: str) -> bool:
+        return self.get(target_umo).allow_request()
+
+    def retry_in(self, target_umo: str) -> float:
+        breaker = self._breakers.get(target_umo)
+        return breaker.retry_in() if breaker else 0.0
+
+    def release_probe(self, target_umo: str):
+        breaker = self._breakers.get(target_umo)
+        if breaker is not None:
+            breaker.release_probe()
+
+    def record_success(self, target_umo: str):
+        self.get(target_umo).record_success()
+
+    def record_failure(self, target_umo: str, error: str = ""):
+        self.get(target_umo).record_failure(error)
+
+    def snapshot(self) -> dict[str, CircuitBreaker]:
+        return dict(self._breakers)
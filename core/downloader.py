@@ -0,0 +1,159 @@
+# 附件下载
+import asyncio
+import os
+import re
+
+import aiohttp
+
+from astrbot.api import logger
+
+
+class DownloadTooLarge(Exception):
+    """下载内容超过大小上限"""
+
+
+class Downloader:
+    """共享的异步 HTTP 下载器
+
+    复用同一个 ClientSession 的连接池 (keep-alive), 通过 connector 限制全局
+    与单个主机的并发连接数; close() 会取消所有进行中的下载并关闭连接池。
+    正文按 ``write_buffer_bytes`` 攒批后在工作线程中写入文件, 大文件不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        per_host_limit: int = 4,
+        timeout: float = 25.0,
+        write_buffer_bytes: int = 1024 * 1024,
+    ):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.timeout = max(1.0, float(timeout))
+        self.write_buffer_bytes = max(64 * 1024, int(write_buffer_bytes))
+        self._session: aiohttp.ClientSession | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._closed = False
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_concurrency,
+                    limit_per_host=self.per_host_limit,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.timeout, sock_read=self.timeout
+                ),
+                headers={"User-Agent": "Mozilla/5.0"},
+            )
+        return self._session
+
+    async def probe_size(self, url: str) -> int | None:
+        """不下载正文获取文件大小: 先发 HEAD, 不支持时用 Range: bytes=0-0 探测"""
+        session = self._get_session()
+        try:
+            async with session.head(url, allow_redirects=True) as resp:
+                if resp.status < 400 and resp.content_length:
+                    return resp.content_length
+        except Exception as exc:
+            logger.debug(f"[Downloader] HEAD 探测失败: {url}, error={exc}")
+
+        try:
+            async with session.get(url, headers={"Range": "bytes=0-0"}) as resp:
+                if resp.status == 206:
+                    m = re.search(r"/(\d+)\s*$", resp.headers.get("Content-Range", ""))
+                    if m:
+                        return int(m.group(1))
+                elif resp.status < 400 and resp.content_length:
+                    # 服务器忽略了 Range，直接按完整响应的长度判断，不读取正文
+                    return resp.content_length
+        except Exception as exc:
+            logger.debug(f"[Downloader] Range 探测失败: {url}, error={exc}")
+        return None
+
+    async def download(
+        self,
+        url: str,
+        target_path: str,
+        max_bytes: int,
+        expected_size: int | None = None,
+        probe: bool = False,
+    ) -> int:
+        """流式下载到 target_path 并返回字节数; 超过 max_bytes 抛出 DownloadTooLarge。
+
+        expected_size 为消息段中给出的文件大小; 未给出且 probe 为真时先探测大小,
+        已知超限则不传输正文。失败时删除不完整的文件。
+        """
+        if self._closed:
+            raise RuntimeError("downloader closed")
+
+        task = asyncio.current_task()
+        if task is not None:
+            self._tasks.add(task)
+        try:
+            size = expected_size
+            if not size and probe:
+                size = await self.probe_size(url)
+            if size and size > max_bytes:
+                raise DownloadTooLarge(url)
+            return await self._download(url, target_path, max_bytes)
+        except BaseException:
+            try:
+                os.remove(target_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            if task is not None:
+                self._tasks.discard(task)
+
+    async def _download(self, url: str, target_path: str, max_bytes: int) -> int:
+        async with self._get_session().get(url) as resp:
+            resp.raise_for_status()
+            if resp.content_length is not None and resp.content_length > max_bytes:
+                raise DownloadTooLarge(url)
+
+            total = 0
+            out = await asyncio.to_thread(open, target_path, "wb")
+            try:
+                pending, pending_bytes = [], 0
+                async for chunk in resp.content.iter_chunked(1024 * 64):
+                    total += len(chunk)
+                    if total > max_bytes:
+                        raise DownloadTooLarge(url)
+                    pending.append(chunk)
+                    pending_bytes += len(chunk)
+                    if pending_bytes >= self.write_buffer_bytes:
+                        await self._write_chunks(out, pending)
+                        pending, pending_bytes = [], 0
+                if pending:
+                    await self._write_chunks(out, pending)
+            finally:
+                out.close()
+            return total
+
+    @staticmethod
+    async def _write_chunks(out, chunks: list):
+        future = asyncio.ensure_future(asyncio.to_thread(out.write, b"".join(chunks)))
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 线程中的写入无法中断，等它完成后再关闭文件
+            await future
+            raise
+
+    async def close(self):
+        self._closed = True
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            try:
+                await self._session.close()
+            except Exception as exc:
+                logger.debug(f"[Downloader] 关闭连接池失败: {exc}")
+        self._session = None
@@ -21,3 +21,46 @@ type2_ids = [
 ]
 
 all_emoji_ids = type1_ids + type2_ids
+
+# 默认计分表: 好表情 +1, 坏表情 -1
+good_emoji_ids = [
+    4, 8, 12, 14, 16, 21, 24, 28, 29, 30, 42, 43, 49, 53, 60, 63, 66, 74,
+    75, 76, 78, 79, 85, 89, 99, 101, 109, 116, 118, 122, 124, 125, 129, 144,
+    147, 171, 175, 179, 180, 182, 183, 201, 203, 212, 214, 219, 222, 227,
+    232, 243, 246, 277, 281, 282, 289, 290, 293, 294, 297, 298, 299, 305,
+    306, 307, 314, 315, 318, 319, 320, 324, 9728, 9749, 9786, 10024, 127801,
+    127817, 127822, 127827, 127836, 127838, 127847, 127866, 127867, 127881,
+    128046, 128051, 128053, 128076, 128077, 128079, 128089, 128102, 128104,
+    128147, 128157, 128164, 128170, 128235, 128293, 128513, 128514, 128516,
+    128522, 128524, 128536, 128538, 128540, 128541
+]
+
+bad_emoji_ids = [
+    5, 9, 10, 23, 25, 26, 27, 32, 33, 34, 38, 39, 41, 96, 97, 98, 100, 102,
+    103, 104, 106, 111, 120, 123, 173, 174, 176, 181, 240, 262, 264, 265,
+    266, 267, 268, 270, 272, 273, 278, 284, 285, 287, 322, 326, 10060,
+    10068, 128027, 128074, 128166, 128168, 128527, 128530, 128531, 128532,
+    128557, 128560, 128563
+]
+
+_type2_id_set = set(type2_ids)
+
+def normalize_emoji_id(emoji_id):
+    """通知和配置中的表情 id 多为字符串, 统一为与上面列表一致的 int"""
+    text = str(emoji_id).strip()
+    return int(text) if text.isdigit() else text
+
+def split_emoji_ids(emoji_ids) -> dict:
+    """把表情id按类型拆分为 fetch_emoji_like 所需的字典, 未知id按系统表情处理
+
+    Args:
+        emoji_ids (Iterable[int]): 表情id
+
+    Returns:
+        dict: {"type1_ids": [...], "type2_ids": [...]}
+    """
+    result = {"type1_ids": [], "type2_ids": []}
+    for emoji_id in dict.fromkeys(emoji_ids):
+        key = "type2_ids" if emoji_id in _type2_id_set else "type1_ids"
+        result[key].append(emoji_id)
+    return result
@@ -0,0 +1,108 @@
+# 贴表情加权计分
+import json
+import os
+import time
+
+from astrbot.api import logger
+from .emoji import bad_emoji_ids, good_emoji_ids, normalize_emoji_id, split_emoji_ids
+
+def parse_weight_items(items) -> dict:
+    """解析配置中的 "表情id:权重" 列表, 无法解析的项会被忽略
+
+    Args:
+        items (list): 形如 ["76:1", "5:-1.5"]
+
+    Returns:
+        dict: 表情id -> 权重
+    """
+    weights = {}
+    for item in items or []:
+        emoji_id, sep, weight = str(item).partition(":")
+        try:
+            if sep and emoji_id.strip():
+                weights[normalize_emoji_id(emoji_id)] = float(weight)
+                continue
+        except ValueError:
+            pass
+        logger.warning(f"[QQ2TG][EmojiScore] 忽略无法解析的表情权重: {item}")
+    return weights
+
+class EmojiScoreTable:
+    """表情id -> 权重的计分表, 分数不低于 threshold 视为通过
+
+    权重预先编译为字典, 计分只需遍历一次计数。指定 path 时从 JSON 文件加载
+    ({"threshold": 0, "weights": {"76": 1, "5": -1}}), 文件修改后在下次计分时自动重新加载,
+    调整规则无需重启插件; 文件缺失或格式错误时沿用当前的计分表。
+
+    Attributes:
+        threshold (float): 通过阈值
+        check_interval (float): 检查文件是否修改的最短间隔 (秒)
+    """
+    def __init__(self, weights: dict = None, threshold: float = 0.0, path: str = "", check_interval: float = 5.0):
+        self.path = str(path or "")
+        self.check_interval = max(0.0, float(check_interval))
+        self._mtime = None
+        self._checked_at = 0.0
+        if weights is None:
+            weights = {emoji_id: 1.0 for emoji_id in good_emoji_ids}
+            weights.update({emoji_id: -1.0 for emoji_id in bad_emoji_ids})
+        self._compile(weights, threshold)
+        if self.path:
+            self.maybe_reload(force=True)
+
+    def _compile(self, weights: dict, threshold: float):
+        compiled = {}
+        for emoji_id, weight in weights.items():
+            weight = float(weight)
+            if weight:
+                compiled[normalize_emoji_id(emoji_id)] = weight
+        self._weights = compiled
+        self.threshold = float(threshold)
+        # 只有权重非零的表情需要查询
+        self.scored_emoji_ids = split_emoji_ids(compiled)
+
+    def maybe_reload(self, force: bool = False):
+        """文件修改过时重新加载计分表"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if force:
+                logger.warning(f"[QQ2TG][EmojiScore] 权重文件不存在, 使用默认计分表: {self.path}")
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            weights = data.get("weights") or {}
+            if not isinstance(weights, dict):
+                raise ValueError("weights 应为对象")
+            self._compile(weights, data.get("threshold", self.threshold))
+        except (OSError, ValueError, TypeError, AttributeError) as exc:
+            logger.error(f"[QQ2TG][EmojiScore] 加载权重文件失败, 沿用当前计分表: {exc}")
+            return
+        finally:
+            self._mtime = mtime
+        logger.info(f"[QQ2TG][EmojiScore] 已加载权重文件: {self.path}, 表情数={len(self._weights)}, 阈值={self.threshold}")
+
+    def score(self, emoji_counts: dict) -> float:
+        """按权重计算一条消息的表情分数
+
+        Args:
+            emoji_counts (dict): 表情id -> 数量
+
+        Returns:
+            float: 分数
+        """
+        weights = self._weights
+        return sum(weights.get(emoji_id, 0.0) * count for emoji_id, count in emoji_counts.items())
+
+    def passes(self, emoji_counts: dict) -> bool:
+        self.maybe_reload()
+        return self.score(emoji_counts) >= self.threshold
@@ -1,25 +1,67 @@
 # 用于评估一条消息是否应该被转发
-from astrbot.api.event import AstrMessageEvent
+import asyncio
 from typing import List
-from .rules import Rule
+
+from astrbot.api import logger
+from ...utils.cache_utils import TTLCache
+from .rules import EvaluationContext, Rule
 
 class Evaluator:
-    """消息评估器，可以组合多个规则进行评估"""
-    def __init__(self, event: AstrMessageEvent):
-        self.event = event
+    """消息评估器，可以组合多个规则进行评估
+
+    规则按 cost 从小到大执行, 任一规则不通过即停止, 代价高的规则 (如需要调用 API 的贴表情规则)
+    只在前面的规则都通过后才会执行。单个规则超时或出错时按通过处理, 不因评估故障丢消息。
+    同一消息的评估结果缓存 cache_ttl 秒。
+
+    Attributes:
+        rule_timeout (float): 规则未指定 timeout 时的默认时限 (秒)
+    """
+    def __init__(self, rules: List[Rule] = None, rule_timeout: float = 3.0, cache_ttl: float = 600):
         self.rules: List[Rule] = []
-    
+        self.rule_timeout = max(0.1, float(rule_timeout))
+        self._results = TTLCache(maxsize=4096, ttl=max(1.0, float(cache_ttl)))
+        for rule in rules or []:
+            self.add_rule(rule)
+
     def add_rule(self, rule: Rule):
-        """添加评估规则"""
+        """添加评估规则, 按 cost 保持有序 (cost 相同时保持添加顺序)"""
         self.rules.append(rule)
-    
-    async def evaluate(self, message_id: int) -> bool:
+        self.rules.sort(key=lambda r: r.cost)
+
+    async def _run_rule(self, rule: Rule, context: EvaluationContext) -> bool:
+        timeout = rule.timeout if rule.timeout is not None else self.rule_timeout
+        try:
+            return bool(await asyncio.wait_for(rule.evaluate(context), timeout))
+        except asyncio.TimeoutError:
+            logger.warning(f"[QQ2TG][Evaluator] 规则 {rule.rule_name} 超时({timeout}s)，按通过处理: msg={context.message_id}")
+        except Exception as exc:
+            logger.warning(f"[QQ2TG][Evaluator] 规则 {rule.rule_name} 出错，按通过处理: msg={context.message_id}, error={exc}")
+        return True
+
+    async def evaluate(self, context: EvaluationContext) -> bool:
         """根据所有规则评估消息
-        
+
         Returns:
             bool: 如果所有规则都通过返回 True，否则返回 False
         """
+        return not await self.rejecting_rule(context)
+
+    async def rejecting_rule(self, context: EvaluationContext) -> str:
+        """根据所有规则评估消息, 返回未通过的规则名
+
+        Returns:
+            str: 第一个未通过的规则名称，全部通过时返回空串
+        """
+        key = str(context.message_id)
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        result = ""
         for rule in self.rules:
-            if not await rule.evaluate(self.event, message_id):
-                return False
-        return True 
\ No newline at end of file
+            if not await self._run_rule(rule, context):
+                logger.info(f"[QQ2TG][Evaluator] 消息未通过规则 {rule.rule_name}: msg={context.message_id}")
+                result = rule.rule_name
+                break
+        self._results.set(key, result)
+        return result
@@ -0,0 +1,87 @@
+# 文本特征提取, 供 ml_evaluator_api 打分与离线训练脚本共用
+# 只依赖标准库, 训练脚本可以脱离插件直接导入本文件
+import math
+import re
+import zlib
+
+DEFAULT_N_FEATURES = 1 << 18
+DEFAULT_NGRAM_RANGE = (1, 3)
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _bucket(token: str, n_features: int) -> int:
+    # 使用 crc32 而不是内置 hash, 保证不同进程之间结果一致
+    return zlib.crc32(token.encode("utf-8")) % n_features
+
+
+def message_inputs(segments) -> tuple:
+    """从消息段得到特征提取的输入, 与 Markdown 归档消息块的内容一致
+
+    有直链的图片与文件记为附件类型, 其余消息段的文本 (含回复、@ 等占位文本)
+    按空格拼接为正文。训练脚本从归档解析出的正是这两部分,
+    运行时打分也必须经过这里, 两边特征才一致。
+
+    Args:
+        segments (list): 解析后的消息段 (utils.message_utils.Segment)
+
+    Returns:
+        tuple: (正文, 附件类型列表)
+    """
+    text_parts, kinds = [], []
+    for seg in segments or []:
+        if seg.kind == "image" and seg.url:
+            kinds.append("image")
+        elif seg.kind == "file":
+            kinds.append("file")
+        elif seg.text:
+            text_parts.append(seg.text)
+    return " ".join(text_parts).strip(), kinds
+
+
+def featurize(
+    text: str,
+    kinds=(),
+    n_features: int = DEFAULT_N_FEATURES,
+    ngram_range=DEFAULT_NGRAM_RANGE,
+) -> dict:
+    """把一条消息转为哈希后的稀疏特征
+
+    文本按字符 n-gram 计数 (中文无需分词), 取 1 + log(tf) 后做 L2 归一化;
+    另有长度区间与附件类型 (image/file) 特征。
+
+    Args:
+        text (str): 消息正文
+        kinds (Iterable[str]): 附件类型
+        n_features (int): 哈希空间大小
+        ngram_range (tuple): n-gram 的最小与最大长度
+
+    Returns:
+        dict: 特征下标 -> 特征值
+    """
+    text = _SPACE_RE.sub(" ", (text or "").lower()).strip()
+    min_n, max_n = int(ngram_range[0]), int(ngram_range[1])
+
+    counts = {}
+    for n in range(min_n, max_n + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i : i + n]
+            if gram.strip():
+                index = _bucket(f"g{n}:{gram}", n_features)
+                counts[index] = counts.get(index, 0) + 1
+
+    features = {}
+    if counts:
+        norm = math.sqrt(sum((1 + math.log(c)) ** 2 for c in counts.values()))
+        for index, c in counts.items():
+            features[index] = (1 + math.log(c)) / norm
+
+    def add(token: str, value: float = 1.0):
+        index = _bucket(token, n_features)
+        features[index] = features.get(index, 0.0) + value
+
+    add(f"len:{min(int(math.log2(len(text) + 1)), 12)}")
+    for kind in set(kinds or ()):
+        if kind in ("image", "file"):
+            add(f"kind:{kind}")
+    return features
@@ -0,0 +1,168 @@
+# 本地 CPU 打分模型: 哈希 n-gram 与附件类型特征上的线性模型
+import asyncio
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖, 未安装时 ml_score 规则不可用
+    np = None
+
+from astrbot.api import logger
+from .featurizer import featurize, message_inputs
+from .rules import EvaluationContext, Rule
+
+
+class LinearModel:
+    """逻辑回归模型, 由 train_ml_evaluator.py 训练后保存为 .npz
+
+    文件包含 weights (n_features,), bias, threshold, ngram_min, ngram_max。
+
+    Attributes:
+        threshold (float): 训练时选定的通过阈值 (概率)
+    """
+
+    def __init__(
+        self, weights, bias: float = 0.0, threshold: float = 0.5, ngram_range=(1, 3)
+    ):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.threshold = float(threshold)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+
+    @property
+    def n_features(self) -> int:
+        return int(self.weights.shape[0])
+
+    @classmethod
+    def load(cls, path: str) -> "LinearModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                weights=data["weights"],
+                bias=float(data["bias"]),
+                threshold=float(data["threshold"]),
+                ngram_range=(int(data["ngram_min"]), int(data["ngram_max"])),
+            )
+
+    def featurize(self, text: str, kinds=()) -> dict:
+        return featurize(
+            text, kinds, n_features=self.n_features, ngram_range=self.ngram_range
+        )
+
+    def score_batch(self, feature_list: list):
+        """一次计算多条消息的通过概率
+
+        Args:
+            feature_list (list): featurize 返回的稀疏特征
+
+        Returns:
+            numpy.ndarray: 各消息的概率
+        """
+        rows, indices, values = [], [], []
+        for row, features in enumerate(feature_list):
+            rows.extend([row] * len(features))
+            indices.extend(features.keys())
+            values.extend(features.values())
+        logits = np.full(len(feature_list), self.bias, dtype=np.float64)
+        if indices:
+            contrib = self.weights[np.asarray(indices, dtype=np.int64)] * np.asarray(
+                values, dtype=np.float64
+            )
+            logits += np.bincount(
+                np.asarray(rows, dtype=np.int64),
+                weights=contrib,
+                minlength=len(feature_list),
+            )
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+class MicroBatchScorer:
+    """把并发到来的打分请求攒成小批量统一计算
+
+    攒够 max_batch 条或最早的请求等待超过 max_delay 秒时计算一次。
+
+    Attributes:
+        model (LinearModel): 打分模型
+    """
+
+    def __init__(
+        self, model: LinearModel, max_batch: int = 32, max_delay: float = 0.005
+    ):
+        self.model = model
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, float(max_delay))
+        self._pending = []
+        self._timer = None
+
+    async def score(self, features: dict) -> float:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((features, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            scores = self.model.score_batch([features for features, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(float(score))
+
+
+def load_scorer(
+    model_path: str, max_batch: int = 32, max_delay: float = 0.005
+) -> MicroBatchScorer:
+    """加载模型文件, numpy 未安装或文件无法读取时返回 None"""
+    if np is None:
+        logger.error("[QQ2TG][ML] 未安装 numpy, ml_score 规则不可用")
+        return None
+    try:
+        model = LinearModel.load(model_path)
+    except Exception as exc:
+        logger.error(f"[QQ2TG][ML] 加载模型失败: {model_path}, error={exc}")
+        return None
+    logger.info(
+        f"[QQ2TG][ML] 已加载模型: {model_path}, "
+        f"特征数={model.n_features}, 阈值={model.threshold}"
+    )
+    return MicroBatchScorer(model, max_batch=max_batch, max_delay=max_delay)
+
+
+class MLScoreRule(Rule):
+    """用本地线性模型给消息打分, 概率不低于阈值时转发
+
+    特征与训练时相同, 只来自消息本身 (见 featurizer.message_inputs),
+    不调用 API, 代价低于 GoodEmojiRule。
+
+    Attributes:
+        scorer (MicroBatchScorer): 打分器
+        threshold (float): 通过阈值, None 表示使用模型文件中的阈值
+    """
+
+    cost = 1.0
+
+    def __init__(
+        self, scorer: MicroBatchScorer, threshold: float = None, timeout: float = None
+    ):
+        super().__init__("MLScoreRule", timeout)
+        self.scorer = scorer
+        self.threshold = threshold
+
+    async def evaluate(self, context: EvaluationContext) -> bool:
+        model = self.scorer.model
+        features = model.featurize(*message_inputs(context.segments))
+        score = await self.scorer.score(features)
+        threshold = model.threshold if self.threshold is None else self.threshold
+        return score >= threshold
@@ -0,0 +1,86 @@
+# 贴表情计数
+from ...utils.cache_utils import TTLCache
+from .emoji import normalize_emoji_id
+
+
+class ReactionCounter:
+    """由贴表情通知增量维护的各消息表情计数
+
+    插件收到的来源群消息通过 track() 登记, 之后的贴表情通知直接更新计数,
+    评估时 get() 为 O(1) 读取而无需调用 fetch_emoji_like。
+    未登记的消息 (插件启动前收到的) get() 返回 None, 由调用方回退到 API 查询。
+    计数保留 ttl 秒 (与 banshi_cache_seconds 一致), 超过后自动淘汰。
+
+    支持的通知:
+      - NapCat ``group_msg_emoji_like``: 带 is_add 时 likes 中的 count 为本次增减的数量 (缺失按 1),
+        is_add 为 true 加、false 减; 不带 is_add 的旧版本 count 为该表情当前总数
+      - Lagrange ``reaction``: count 为当前总数, 缺失时按 sub_type add/remove 加减 1
+    """
+
+    def __init__(self, ttl: float = 3600, maxsize: int = 50000):
+        self._counts = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(message_id) -> str:
+        return str(message_id)
+
+    def track(self, message_id):
+        """登记一条新收到的消息, 此后它的表情计数以通知为准"""
+        key = self._key(message_id)
+        if self._counts.get(key) is None:
+            self._counts.set(key, {})
+
+    def discard(self, message_id):
+        self._counts.pop(self._key(message_id))
+
+    def get(self, message_id) -> dict | None:
+        """返回 {表情id: 数量}; 未登记的消息返回 None"""
+        counts = self._counts.get(self._key(message_id))
+        return dict(counts) if counts is not None else None
+
+    def is_tracked(self, message_id) -> bool:
+        return self._key(message_id) in self._counts
+
+    def handle_notice(self, raw_event: dict) -> bool:
+        """处理贴表情通知, 返回是否为贴表情通知"""
+        notice_type = raw_event.get("notice_type")
+        if notice_type == "group_msg_emoji_like":
+            counts = self._counts.get(self._key(raw_event.get("message_id")))
+            if counts is None:
+                return True
+            is_add = raw_event.get("is_add")
+            if isinstance(is_add, str):
+                is_add = is_add.lower() not in ("false", "0", "")
+            for like in raw_event.get("likes") or []:
+                if not isinstance(like, dict) or like.get("emoji_id") is None:
+                    continue
+                emoji_id = normalize_emoji_id(like["emoji_id"])
+                try:
+                    if is_add is None:
+                        counts[emoji_id] = max(0, int(like.get("count", 0)))
+                    else:
+                        delta = int(like.get("count", 1))
+                        if not is_add:
+                            delta = -delta
+                        counts[emoji_id] = max(0, counts.get(emoji_id, 0) + delta)
+                except (TypeError, ValueError):
+                    continue
+            return True
+
+        if notice_type == "reaction":
+            counts = self._counts.get(self._key(raw_event.get("message_id")))
+            if counts is None or raw_event.get("code") is None:
+                return True
+            emoji_id = normalize_emoji_id(raw_event["code"])
+            count = raw_event.get("count")
+            try:
+                if count is not None:
+                    counts[emoji_id] = max(0, int(count))
+                else:
+                    delta = -1 if raw_event.get("sub_type") == "remove" else 1
+                    counts[emoji_id] = max(0, counts.get(emoji_id, 0) + delta)
+            except (TypeError, ValueError):
+                pass
+            return True
+
+        return False
@@ -1,51 +1,134 @@
-# 用于评价的贴表情规则
-from typing import Any, Coroutine
+# 用于评价的规则
 from ..message_handler import MessageHandler
-from astrbot.api.event import AstrMessageEvent
+from .emoji_score import EmojiScoreTable
+from .reaction_counter import ReactionCounter
+
+class EvaluationContext:
+    """一条待评估消息的上下文, 由转发流程构造后交给各规则
+
+    Attributes:
+        client: QQ 协议端客户端, 需要调用 API 的规则使用
+        message_id (int): 消息id
+        group_id (str): 来源群号
+        segments (list): 解析后的消息段 (utils.message_utils.Segment)
+        text (str): 所有文本段拼接后的内容, 不含回复、@、表情等非文本段
+    """
+    def __init__(self, client, message_id, group_id: str = "", segments: list = None, text: str = ""):
+        self.client = client
+        self.message_id = message_id
+        self.group_id = group_id
+        self.segments = segments or []
+        self.text = text
 
 class Rule:
     """评价一条转发消息是否应该被转发的抽象基类, 任何具体的规则需要继承此类
-    
+
     Attributes:
         rule_name (str): 规则名称
+        cost (float): 评估代价, Evaluator 按从小到大的顺序执行, 纯文本检查为 0, 需要调用 API 的规则更大
+        timeout (float): 单次评估的时限 (秒), None 表示使用 Evaluator 的默认值
     """
-    def __init__(self, rule_name: str):
+    cost = 0.0
+
+    def __init__(self, rule_name: str, timeout: float = None):
         self.rule_name = rule_name
-    
-    async def evaluate(self, message_id: int) -> bool:
+        self.timeout = timeout
+
+    async def evaluate(self, context: EvaluationContext) -> bool:
         """评价一条转发消息是否应该被转发
 
         Args:
-            message_id (int): 消息id
+            context (EvaluationContext): 消息上下文
 
         Returns:
             bool: 是否应该被转发
         """
+        raise NotImplementedError
+
+class KeywordRule(Rule):
+    """消息文本包含任一屏蔽关键词时不转发"""
+    def __init__(self, keywords: list):
+        super().__init__("KeywordRule")
+        self.keywords = [str(x) for x in keywords or [] if str(x)]
+
+    async def evaluate(self, context: EvaluationContext) -> bool:
+        return not any(keyword in context.text for keyword in self.keywords)
+
+class MinLengthRule(Rule):
+    """纯文本消息的字数低于下限时不转发, 含图片、文件或合并转发的消息不受限制"""
+    def __init__(self, min_length: int):
+        super().__init__("MinLengthRule")
+        self.min_length = max(0, int(min_length))
+
+    async def evaluate(self, context: EvaluationContext) -> bool:
+        if any(seg.kind in ("image", "file", "forward") for seg in context.segments):
+            return True
+        return len(context.text.strip()) >= self.min_length
 
 class GoodEmojiRule(Rule):
-    """评价一条转发消息是否应该被转发的规则, 依据点赞和点踩的数量之差"""
-    def __init__(self):
-        super().__init__("GoodEmojiRule")
-        self.good_emoji_ids = [4, 8, 12, 14, 16, 21, 24, 28, 29, 30, 42, 43, 49, 53, 60, 63, 66, 74, 75, 76, 78, 79, 85, 89, 99, 101, 109, 116, 118, 122, 124, 125, 129, 144, 147, 171, 175, 179, 180, 182, 183, 201, 203, 212, 214, 219, 222, 227, 232, 243, 246, 277, 281, 282, 289, 290, 293, 294, 297, 298, 299, 305, 306, 307, 314, 315, 318, 319, 320, 324, 9728, 9749, 9786, 10024, 127801, 127817, 127822, 127827, 127836, 127838, 127847, 127866, 127867, 127881, 128046, 128051, 128053, 128076, 128077, 128079, 128089, 128102, 128104, 128147, 128157, 128164, 128170, 128235, 128293, 128513, 128514, 128516, 128522, 128524, 128536, 128538, 128540, 128541]
-        self.bad_emoji_ids = [5, 9, 10, 23, 25, 26, 27, 32, 33, 34, 38, 39, 41, 96, 97, 98, 100, 102, 103, 104, 106, 111, 120, 123, 173, 174, 176, 181, 240, 262, 264, 265, 266, 267, 268, 270, 272, 273, 278, 284, 285, 287, 322, 326, 10060, 10068, 128027, 128074, 128166, 128168, 128527, 128530, 128531, 128532, 128557, 128560, 128563]
-
-    async def evaluate(self, event: AstrMessageEvent, message_id: int) -> bool:
-        """评价一条转发消息是否应该被转发, 规则: 好表情数量大于坏表情数量
-        
+    """评价一条转发消息是否应该被转发的规则, 依据贴表情的加权分数
+
+    默认计分表为好表情 +1、坏表情 -1、阈值 0, 即好表情数量不少于坏表情数量时通过。
+    贴表情需要时间累积, 启用本规则的群按 evaluation_emoji_min_wait_seconds 延后评估。
+
+    Attributes:
+        reaction_counter (ReactionCounter): 由贴表情通知维护的计数, 可选;
+            消息已登记时直接读取, 否则回退到 fetch_emoji_like 查询
+        score_table (EmojiScoreTable): 表情计分表
+    """
+    cost = 10.0
+
+    def __init__(self, reaction_counter: ReactionCounter = None, score_table: EmojiScoreTable = None, timeout: float = None):
+        super().__init__("GoodEmojiRule", timeout)
+        self.reaction_counter = reaction_counter
+        self.score_table = score_table or EmojiScoreTable()
+
+    async def _emoji_counts(self, context: EvaluationContext) -> dict:
+        emoji_count_dict = None
+        if self.reaction_counter is not None:
+            emoji_count_dict = self.reaction_counter.get(context.message_id)
+        if emoji_count_dict is None:
+            # 只查询参与计分的表情, 权重为 0 的表情不影响结果
+            emoji_ids = self.score_table.scored_emoji_ids
+            message_handler = MessageHandler(client=context.client)
+            emoji_count_dict = await message_handler.fetch_emoji_like(context.message_id, emoji_ids)
+            expected = sum(len(ids) for ids in emoji_ids.values())
+            if len(emoji_count_dict) < expected:
+                # 缺失的表情按 0 计会让分数失真, 交给 Evaluator 按出错处理
+                raise RuntimeError(f"贴表情计数不完整: {len(emoji_count_dict)}/{expected}")
+        return emoji_count_dict
+
+    async def evaluate(self, context: EvaluationContext) -> bool:
+        """评价一条转发消息是否应该被转发, 规则: 表情分数不低于计分表阈值
+
         Args:
-            event (AstrMessageEvent): 事件, 用于传递客户端
-            message_id (int): 消息id
+            context (EvaluationContext): 消息上下文, 回退查询时使用其中的客户端
 
         Returns:
             bool: 是否应该被转发
         """
-        message_handler = MessageHandler(event)
-        emoji_count_dict = await message_handler.fetch_emoji_like(message_id)
-        good_emoji_count = 0
-        bad_emoji_count = 0
-        for emoji_id, emoji_count in emoji_count_dict.items():
-            if emoji_id in self.good_emoji_ids:
-                good_emoji_count += emoji_count
-            elif emoji_id in self.bad_emoji_ids:
-                bad_emoji_count += emoji_count
-        return good_emoji_count >= bad_emoji_count
\ No newline at end of file
+        return self.score_table.passes(await self._emoji_counts(context))
+
+def create_rule(name: str, options: dict) -> Rule:
+    """按配置中的规则名创建规则
+
+    Args:
+        name (str): 规则名, 可选 keyword / min_length / good_emoji / ml_score
+        options (dict): 规则参数, 见 main.py 中的 evaluation_* 配置
+
+    Returns:
+        Rule: 规则实例, 未知规则名或规则不可用 (如未配置模型) 时返回 None
+    """
+    name = str(name).strip().lower()
+    if name == "keyword":
+        return KeywordRule(options.get("keywords", []))
+    if name == "min_length":
+        return MinLengthRule(options.get("min_length", 0))
+    if name == "good_emoji":
+        return GoodEmojiRule(options.get("reaction_counter"), options.get("emoji_score_table"))
+    if name == "ml_score":
+        if options.get("ml_scorer") is None:
+            return None
+        from .ml_evaluator_api import MLScoreRule
+        return MLScoreRule(options["ml_scorer"], options.get("ml_threshold"))
+    return None
@@ -0,0 +1,236 @@
+# 离线训练 ml_score 规则使用的线性模型
+#
+# 用法:
+#   python core/evaluation/train_ml_evaluator.py <archive_root> -o model.npz
+#
+# 读取 Markdown 归档中所有 messages.md (按天或按群分区的布局均可),
+# 用 numpy 训练逻辑回归:
+#   - 正样本: 未标记 [ignore] 的消息块
+#   - 负样本: 带 "- 评估未通过: `规则名`" 且规则属于 --negative-rules 的块
+#     (默认关键词、字数与贴表情规则; 不含 MLScoreRule, 避免模型学习自己的判断)
+#   - 其余 [ignore] 块 (群前缀抑制等) 与内容质量无关, 不参与训练
+# 正文与附件类型的解析对应 featurizer.message_inputs, 运行时打分使用相同的输入。
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from featurizer import DEFAULT_N_FEATURES, featurize  # noqa: E402
+
+_BLOCK_SPLIT_RE = re.compile(r"(?<=\n---\n)(?=## )")
+_REJECTED_PREFIX = "- 评估未通过:"
+DEFAULT_NEGATIVE_RULES = ("KeywordRule", "MinLengthRule", "GoodEmojiRule")
+
+
+def iter_archive_files(archive_root: str):
+    for dirpath, dirnames, filenames in os.walk(archive_root):
+        dirnames[:] = sorted(
+            d for d in dirnames if d not in ("index", "blobs", "combined")
+        )
+        if "messages.md" in filenames:
+            yield os.path.join(dirpath, "messages.md")
+
+
+def parse_block(block: str, negative_rules=DEFAULT_NEGATIVE_RULES):
+    """返回 (正文, 消息段类型列表, 是否为正样本)
+
+    无法识别的块、以及不是被 negative_rules 中的规则拦下的 [ignore] 块返回 None。
+    """
+    lines = block.strip("\n").split("\n")
+    if not lines or not lines[0].startswith("## "):
+        return None
+    ignored = lines[0].startswith("## [ignore]")
+    rejected_by = ""
+
+    body, kinds = [], []
+    in_body = in_attachments = False
+    for line in lines[1:]:
+        if line == "---":
+            break
+        if not in_body:
+            # 头部为 "- 来源群/发送者/消息ID" 几行, 之后一个空行开始正文
+            if line.startswith(_REJECTED_PREFIX):
+                rejected_by = line[len(_REJECTED_PREFIX) :].strip().strip("`")
+            in_body = line == ""
+            continue
+        if line == "附件:":
+            in_attachments = True
+        elif in_attachments:
+            if line.startswith("- 图片:"):
+                kinds.append("image")
+            elif line.startswith("- 文件:"):
+                kinds.append("file")
+        else:
+            body.append(line)
+    if ignored and rejected_by not in negative_rules:
+        return None
+    text = "\n".join(body).strip()
+    if text == "[空消息]":
+        text = ""
+    return text, kinds, not ignored
+
+
+def load_samples(archive_root: str, negative_rules=DEFAULT_NEGATIVE_RULES):
+    samples = []
+    for path in iter_archive_files(archive_root):
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        for block in _BLOCK_SPLIT_RE.split(content):
+            parsed = parse_block(block, negative_rules)
+            if parsed is not None:
+                samples.append(parsed)
+    return samples
+
+
+def train(
+    features, labels, n_features: int, epochs: int, lr: float, l2: float, seed: int = 0
+):
+    """带类别平衡的逻辑回归, Adagrad 逐样本更新稀疏特征"""
+    rng = np.random.default_rng(seed)
+    weights = np.zeros(n_features, dtype=np.float64)
+    grad_sq = np.full(n_features, 1e-8)
+    bias, bias_sq = 0.0, 1e-8
+    labels = np.asarray(labels, dtype=np.float64)
+    pos = max(labels.sum(), 1.0)
+    neg = max(len(labels) - labels.sum(), 1.0)
+    class_weight = {1.0: len(labels) / (2 * pos), 0.0: len(labels) / (2 * neg)}
+    rows = [
+        (
+            np.fromiter(f.keys(), dtype=np.int64, count=len(f)),
+            np.fromiter(f.values(), dtype=np.float64, count=len(f)),
+        )
+        for f in features
+    ]
+
+    for epoch in range(epochs):
+        loss = 0.0
+        for i in rng.permutation(len(rows)):
+            idx, val = rows[i]
+            y = labels[i]
+            z = bias + float(weights[idx] @ val)
+            p = 1.0 / (1.0 + np.exp(-z))
+            loss += -class_weight[y] * (
+                y * np.log(p + 1e-12) + (1 - y) * np.log(1 - p + 1e-12)
+            )
+            g = class_weight[y] * (p - y)
+            grad = g * val + l2 * weights[idx]
+            grad_sq[idx] += grad * grad
+            weights[idx] -= lr * grad / np.sqrt(grad_sq[idx])
+            bias_sq += g * g
+            bias -= lr * g / np.sqrt(bias_sq)
+        print(f"epoch {epoch + 1}/{epochs}: loss={loss / max(len(rows), 1):.4f}")
+    return weights, bias
+
+
+def predict(weights, bias: float, features):
+    scores = []
+    for f in features:
+        idx = np.fromiter(f.keys(), dtype=np.int64, count=len(f))
+        val = np.fromiter(f.values(), dtype=np.float64, count=len(f))
+        scores.append(bias + float(weights[idx] @ val))
+    return 1.0 / (1.0 + np.exp(-np.asarray(scores)))
+
+
+def pick_threshold(probs, labels) -> float:
+    """选取使正样本 F1 最大的阈值"""
+    labels = np.asarray(labels, dtype=bool)
+    best, best_f1 = 0.5, -1.0
+    for threshold in np.linspace(0.05, 0.95, 91):
+        pred = probs >= threshold
+        tp = float(np.sum(pred & labels))
+        precision = tp / max(float(pred.sum()), 1.0)
+        recall = tp / max(float(labels.sum()), 1.0)
+        f1 = 2 * precision * recall / max(precision + recall, 1e-12)
+        # F1 相同时取更接近 0.5 的阈值
+        if f1 > best_f1 + 1e-9 or (
+            abs(f1 - best_f1) <= 1e-9 and abs(threshold - 0.5) < abs(best - 0.5)
+        ):
+            best, best_f1 = round(float(threshold), 4), f1
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="从 Markdown 归档训练 ml_score 规则的模型"
+    )
+    parser.add_argument("archive_root", help="归档根目录 (archive_root)")
+    parser.add_argument(
+        "-o", "--output", default="qq2tg_ml_model.npz", help="输出的模型文件"
+    )
+    parser.add_argument(
+        "--n-features", type=int, default=DEFAULT_N_FEATURES, help="哈希空间大小"
+    )
+    parser.add_argument("--ngram-min", type=int, default=1)
+    parser.add_argument("--ngram-max", type=int, default=3)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-6)
+    parser.add_argument(
+        "--negative-rules",
+        default=",".join(DEFAULT_NEGATIVE_RULES),
+        help="被这些规则拦下的消息作为负样本, 逗号分隔",
+    )
+    parser.add_argument("--holdout", type=float, default=0.2, help="留作验证的样本比例")
+    args = parser.parse_args(argv)
+
+    negative_rules = {x.strip() for x in args.negative_rules.split(",") if x.strip()}
+    samples = load_samples(args.archive_root, negative_rules)
+    labels = [1.0 if positive else 0.0 for _, _, positive in samples]
+    if not samples or len(set(labels)) < 2:
+        print(
+            "归档中需要同时包含普通消息块与被评估规则拦下的消息块才能训练",
+            file=sys.stderr,
+        )
+        return 1
+    print(
+        f"样本数: {len(samples)}, 正样本: {int(sum(labels))}, "
+        f"负样本: {len(labels) - int(sum(labels))}"
+    )
+
+    ngram_range = (args.ngram_min, args.ngram_max)
+    features = [
+        featurize(text, kinds, n_features=args.n_features, ngram_range=ngram_range)
+        for text, kinds, _ in samples
+    ]
+
+    order = np.random.default_rng(1).permutation(len(samples))
+    n_holdout = int(len(samples) * args.holdout) if len(samples) >= 10 else 0
+    valid_idx, train_idx = order[:n_holdout], order[n_holdout:]
+
+    weights, bias = train(
+        [features[i] for i in train_idx],
+        [labels[i] for i in train_idx],
+        args.n_features,
+        args.epochs,
+        args.lr,
+        args.l2,
+    )
+    eval_idx = valid_idx if n_holdout else train_idx
+    probs = predict(weights, bias, [features[i] for i in eval_idx])
+    eval_labels = [labels[i] for i in eval_idx]
+    threshold = pick_threshold(probs, eval_labels)
+    accuracy = float(
+        np.mean((probs >= threshold) == np.asarray(eval_labels, dtype=bool))
+    )
+    print(
+        f"{'验证集' if n_holdout else '训练集'}准确率: {accuracy:.3f}, "
+        f"阈值: {threshold:.2f}"
+    )
+
+    np.savez(
+        args.output,
+        weights=weights.astype(np.float32),
+        bias=np.float64(bias),
+        threshold=np.float64(threshold),
+        ngram_min=np.int64(ngram_range[0]),
+        ngram_max=np.int64(ngram_range[1]),
+    )
+    print(f"模型已保存: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,51 +1,73 @@
 # 消息处理
-from astrbot.api.event import filter, AstrMessageEvent
+import asyncio
+
+from astrbot.api import logger
+from astrbot.api.event import AstrMessageEvent
+from ..utils.cache_utils import TTLCache
 from .evaluation.emoji import type1_ids, type2_ids
 
+# 各表情计数的短期缓存, 键为 (消息id, 表情id, 表情类型); 所有 MessageHandler 共用
+_emoji_like_cache = TTLCache(maxsize=8192, ttl=15)
+
 class MessageHandler:
-    def __init__(self, event: AstrMessageEvent):
+    """消息相关的 API 封装, 可传入事件 (使用 event.bot) 或直接传入客户端
+
+    Attributes:
+        max_concurrency (int): 单次查询同时进行的 API 调用数上限
+        cache_ttl (float): 表情计数的缓存秒数, 0 表示不缓存
+    """
+    def __init__(self, event: AstrMessageEvent = None, max_concurrency: int = 16, cache_ttl: float = 15, client=None):
         self.event = event
-        pass
+        self.client = client if client is not None else event.bot
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.cache_ttl = max(0.0, float(cache_ttl))
+
     async def fetch_emoji_like(self, message_id: int, emoji_ids: dict = None):
         """获取消息的各种贴表情数量, 默认获取所有表情数量
 
+        各表情的查询并发进行 (不超过 max_concurrency 个), 结果缓存 cache_ttl 秒;
+        只关心部分表情时应传入 emoji_ids 以减少 API 调用。
+        查询失败的表情不出现在结果中 (也不缓存), 调用方可据此判断结果是否完整。
+
         Args:
             message_id (int): 消息id
-            emoji_ids (dict): 表情id字典, 键为表情id, 值为表情类型, 可选
+            emoji_ids (dict): 表情id字典, 键为 "type1_ids"/"type2_ids", 值为表情id列表, 可选
         Returns:
-            dict: 表情数量字典, 键为表情id, 值为表情数量
+            dict: 表情数量字典, 键为表情id, 值为表情数量, 只包含查询成功的表情
         """
-        client = self.event.bot
-        emoji_count_dict = {}
+        client = self.client
         if not emoji_ids:
             emoji_ids = {
                 "type1_ids": type1_ids,
                 "type2_ids": type2_ids
             }
-        for id in emoji_ids["type1_ids"]:
-            payloads = {
-                "message_id": message_id,
-                "emojiId": id,
-                "emojiType": 1
-            }
-            response = await client.api.call_action("fetch_emoji_like", **payloads)
-            emojiLikesList = response.get("emojiLikesList")
-            if emojiLikesList:
-                emoji_count_dict[id] = len(emojiLikesList)
-            else:
-                emoji_count_dict[id] = 0
-        for id in emoji_ids["type2_ids"]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch_one(emoji_id, emoji_type: int):
+            key = (str(message_id), emoji_id, emoji_type)
+            count = _emoji_like_cache.get(key)
+            if count is not None:
+                return emoji_id, count
             payloads = {
                 "message_id": message_id,
-                "emojiId": id,
-                "emojiType": 2
+                "emojiId": emoji_id,
+                "emojiType": emoji_type
             }
-            response = await client.api.call_action("fetch_emoji_like", **payloads)
-            emojiLikesList = response.get("emojiLikesList")
-            if emojiLikesList:
-                emoji_count_dict[id] = len(emojiLikesList)
-            else:
-                emoji_count_dict[id] = 0
-        return emoji_count_dict
-    
+            async with semaphore:
+                try:
+                    response = await client.api.call_action("fetch_emoji_like", **payloads)
+                except Exception as exc:
+                    # 失败不缓存, 下次评估时重新获取
+                    logger.warning(f"[QQ2TG] 获取贴表情失败: msg={message_id}, emoji={emoji_id}, error={exc}")
+                    return emoji_id, None
+            emojiLikesList = (response or {}).get("emojiLikesList")
+            count = len(emojiLikesList) if emojiLikesList else 0
+            if self.cache_ttl:
+                _emoji_like_cache.set(key, count, ttl=self.cache_ttl)
+            return emoji_id, count
 
+        results = await asyncio.gather(
+            *(fetch_one(id, 1) for id in emoji_ids.get("type1_ids", [])),
+            *(fetch_one(id, 2) for id in emoji_ids.get("type2_ids", [])),
+        )
+        return {emoji_id: count for emoji_id, count in results if count is not None}
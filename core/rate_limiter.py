@@ -0,0 +1,76 @@
+# 转发限速
+import asyncio
+import time
+
+
+class TokenBucket:
+    """令牌桶限速器, rate 为每秒补充的令牌数, burst 为桶容量"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def pause(self, seconds: float):
+        """平台返回 retry-after 时暂停发放令牌"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    async def acquire(self, tokens: float = 1.0):
+        """取出令牌, 令牌不足时等待到补足为止; rate <= 0 表示不限速"""
+        async with self._lock:
+            while True:
+                paused = self._paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class TargetRateLimiter:
+    """按目标会话 (unified_msg_origin) 独立限速, 速率按平台配置"""
+
+    def __init__(
+        self,
+        platform_limits: dict[str, tuple[float, float]] | None = None,
+        default_limit: tuple[float, float] = (0.0, 1.0),
+    ):
+        self.platform_limits = dict(platform_limits or {})
+        self.default_limit = default_limit
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def _bucket_for(self, target_umo: str, platform: str) -> TokenBucket:
+        bucket = self._buckets.get(target_umo)
+        if bucket is None:
+            rate, burst = self.platform_limits.get(platform, self.default_limit)
+            bucket = TokenBucket(rate, burst)
+            self._buckets[target_umo] = bucket
+        return bucket
+
+    async def acquire(self, target_umo: str, platform: str = ""):
+        await self._bucket_for(target_umo, platform).acquire()
+
+    def pause(self, target_umo: str, seconds: float, platform: str = ""):
+        self._bucket_for(target_umo, platform).pause(seconds)
+
+    def paused_for(self, target_umo: str) -> float:
+        bucket = self._buckets.get(target_umo)
+        return bucket.paused_for() if bucket else 0.0
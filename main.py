@@ -1,12 +1,10 @@
 import asyncio
-import html
-import json
 import os
 import re
 import tempfile
 import time
 import uuid
-import urllib.request
+from contextlib import aclosing
 from datetime import datetime, time as dtime
 from urllib.parse import parse_qsl, quote, urlsplit, urlunsplit
 
@@ -16,8 +14,36 @@ import astrbot.api.message_components as Comp
 from astrbot.api.star import Context, Star, register
 from astrbot.core.star.filter.platform_adapter_type import PlatformAdapterType
 
+from .core.attachment_broker import AttachmentBroker
+from .core.circuit_breaker import TargetCircuitBreakers
+from .core.downloader import Downloader, DownloadTooLarge
+from .core.evaluation.emoji_score import EmojiScoreTable, parse_weight_items
+from .core.evaluation.evaluator import Evaluator
+from .core.evaluation.featurizer import message_inputs
+from .core.evaluation.ml_evaluator_api import load_scorer
+from .core.evaluation.reaction_counter import ReactionCounter
+from .core.evaluation.rules import EvaluationContext, GoodEmojiRule, create_rule
+from .core.rate_limiter import TargetRateLimiter
+from .storage.archive_writer import ArchiveWriter
+from .storage.group_info_cache import GroupInfoCache
 from .storage.local_cache import LocalCache
 from .storage.markdown_archive import MarkdownArchive
+from .storage.retry_queue import (
+    DeliveryHeld,
+    DeliveryRetryQueue,
+    extract_retry_after,
+)
+from .utils.cache_utils import TTLCache
+from .utils.message_utils import (
+    ExpandBudget,
+    Segment,
+    asset_fingerprints,
+    is_http_url,
+    parse_segments,
+    plain_text,
+    render_text,
+    text_content,
+)
 
 
 @register("astrbot_qq_to_telegram", "guiguisocute", "QQ 本地归档与多平台转发插件", "1.1.6")
@@ -46,6 +72,9 @@ class SowingDiscord(Star):
         self.banshi_group_list = self._normalize_int_list(
             config.get("banshi_group_list")
         )
+        self._source_group_keys = frozenset(
+            str(group_id) for group_id in self.banshi_group_list
+        )
         self.banshi_target_list = self._normalize_int_list(
             config.get("banshi_target_list")
         )
@@ -62,12 +91,29 @@ class SowingDiscord(Star):
         )
 
         self.block_source_messages = bool(config.get("block_source_messages", False))
+        self.capture_message_payload = bool(config.get("capture_message_payload", True))
         self.banshi_waiting_time = int(config.get("banshi_waiting_time", 1))
+        # 贴表情通知需要时间累积，启用 good_emoji 的群至少等待这么久再评估
+        self.evaluation_emoji_min_wait = max(
+            0, int(config.get("evaluation_emoji_min_wait_seconds", 300))
+        )
         self.telegram_upload_files = bool(config.get("telegram_upload_files", True))
         self.telegram_upload_max_mb = int(config.get("telegram_upload_max_mb", 10))
         self.telegram_upload_max_bytes = (
             max(1, self.telegram_upload_max_mb) * 1024 * 1024
         )
+        self.target_rate_limiter = TargetRateLimiter(
+            platform_limits={
+                "telegram": (
+                    float(config.get("telegram_send_rate", 1.0)),
+                    float(config.get("telegram_send_burst", 3)),
+                ),
+                "discord": (
+                    float(config.get("discord_send_rate", 1.0)),
+                    float(config.get("discord_send_burst", 5)),
+                ),
+            }
+        )
 
         self.enable_telegram_forward = bool(config.get("enable_telegram_forward", True))
         self.enable_markdown_archive = bool(config.get("enable_markdown_archive", True))
@@ -76,11 +122,25 @@ class SowingDiscord(Star):
         )
         self.archive_save_assets = bool(config.get("archive_save_assets", True))
         self.archive_asset_max_mb = int(config.get("archive_asset_max_mb", 20))
+        self.downloader = Downloader(
+            max_concurrency=int(config.get("download_max_concurrency", 8)),
+            per_host_limit=int(config.get("download_per_host_limit", 4)),
+        )
         self.markdown_archive = (
             MarkdownArchive(
                 root_dir=self.archive_root,
                 save_assets=self.archive_save_assets,
                 asset_max_mb=self.archive_asset_max_mb,
+                downloader=self.downloader,
+                index_expire_days=int(config.get("archive_index_expire_days", 0)),
+                writer=ArchiveWriter(
+                    flush_interval=float(config.get("archive_flush_seconds", 2)),
+                    flush_bytes=int(config.get("archive_flush_kb", 64)) * 1024,
+                    durability=str(config.get("archive_durability", "interval")),
+                ),
+                partition_by_group=bool(
+                    config.get("archive_partition_by_group", False)
+                ),
             )
             if self.enable_markdown_archive
             else None
@@ -90,9 +150,82 @@ class SowingDiscord(Star):
             max_age_seconds=self.banshi_cache_seconds,
             waiting_time=self.banshi_waiting_time,
         )
+        self.reaction_counter = ReactionCounter(ttl=self.banshi_cache_seconds)
+        self._rule_options = {
+            "keywords": list(config.get("evaluation_block_keywords", []) or []),
+            "min_length": int(config.get("evaluation_min_text_length", 0)),
+            "reaction_counter": self.reaction_counter,
+            "emoji_score_table": EmojiScoreTable(
+                weights=parse_weight_items(config.get("evaluation_emoji_weights", []))
+                or None,
+                threshold=float(config.get("evaluation_emoji_threshold", 0)),
+                path=str(config.get("evaluation_emoji_weights_file", "") or ""),
+            ),
+            "ml_scorer": self._load_ml_scorer(config),
+            "ml_threshold": float(config.get("evaluation_ml_threshold", 0)) or None,
+            "rule_timeout": float(config.get("evaluation_rule_timeout", 3)),
+            "cache_ttl": float(config.get("evaluation_cache_seconds", 600)),
+        }
+        self._default_evaluator = self._build_evaluator(
+            config.get("evaluation_rules", []) or []
+        )
+        # 按群覆盖规则链，每项形如 "群号:规则1,规则2"，规则为空表示该群不评估
+        self._group_evaluators: dict[str, Evaluator | None] = {}
+        for item in config.get("evaluation_group_rules", []) or []:
+            group_text, sep, names = str(item).partition(":")
+            group_key = self._group_state_key(group_text)
+            if not sep or not group_key:
+                logger.warning(f"[QQ2TG] 忽略无法解析的分群规则配置: {item}")
+                continue
+            self._group_evaluators[group_key] = self._build_evaluator(names.split(","))
+        self._forward_msg_cache = TTLCache(
+            maxsize=int(config.get("forward_msg_cache_size", 256)),
+            ttl=float(config.get("forward_msg_cache_seconds", 600)),
+        )
+        self._forward_msg_inflight: dict[str, asyncio.Future] = {}
+        # 消息id -> 已交付的 (展开序号, 目标)，通道重试同一条消息时跳过这些发送
+        self._delivered_entries = TTLCache(
+            maxsize=4096, ttl=max(60.0, float(self.banshi_cache_seconds))
+        )
+        self._forward_prefetch_tasks: set[asyncio.Task] = set()
+        self.forward_expand_max_nodes = max(
+            0, int(config.get("forward_expand_max_nodes", 500))
+        )
+        self.forward_expand_max_bytes = (
+            max(0, int(config.get("forward_expand_max_kb", 4096))) * 1024
+        )
+        self._forward_fetch_semaphore = asyncio.Semaphore(
+            max(1, int(config.get("forward_expand_concurrency", 4)))
+        )
+        self.group_info_cache = GroupInfoCache(
+            ttl_seconds=int(config.get("group_info_cache_seconds", 3600)),
+            persist=bool(config.get("group_info_cache_persist", True)),
+        )
+        self._group_warm_task = None
+        self.target_breakers = TargetCircuitBreakers(
+            failure_threshold=int(config.get("circuit_failure_threshold", 5)),
+            recovery_seconds=float(config.get("circuit_recovery_seconds", 60)),
+        )
+        self.delivery_retry_queue = DeliveryRetryQueue(
+            send_func=self._deliver_chain_data,
+            hold_func=self.target_breakers.retry_in,
+            max_attempts=int(config.get("delivery_retry_max_attempts", 5)),
+            base_delay=float(config.get("delivery_retry_base_seconds", 5)),
+            max_delay=float(config.get("delivery_retry_max_seconds", 600)),
+            max_pending_per_target=int(
+                config.get("delivery_retry_max_pending_per_target", 500)
+            ),
+        )
 
-        self.forward_lock = asyncio.Lock()
+        self.forward_max_parallel_groups = max(
+            1, int(config.get("forward_max_parallel_groups", 4))
+        )
+        self._lane_semaphore = asyncio.Semaphore(self.forward_max_parallel_groups)
+        self._lane_queues: dict[str, asyncio.Queue] = {}
+        self._forward_lanes: dict[str, asyncio.Task] = {}
         self._forward_task = None
+        self._qq_client = None
+        self._qq_client_ready = asyncio.Event()
         self._group_prefix_blocked: set[str] = set()
 
         logger.info(f"[QQ2TG][ID:{self.instance_id}] 插件初始化完成")
@@ -108,6 +241,8 @@ class SowingDiscord(Star):
                 f"[QQ2TG][ID:{self.instance_id}] Markdown 归档目录: {self.archive_root}"
             )
 
+        self._ensure_forward_worker()
+
     @staticmethod
     def _normalize_int_list(raw):
         if isinstance(raw, (int, str)):
@@ -154,12 +289,7 @@ class SowingDiscord(Star):
         return self.cooldown_night_seconds
 
     def _is_source_group(self, group_id_raw) -> bool:
-        if group_id_raw in self.banshi_group_list:
-            return True
-        try:
-            return int(group_id_raw) in self.banshi_group_list
-        except (ValueError, TypeError):
-            return False
+        return self._group_state_key(group_id_raw) in self._source_group_keys
 
     @staticmethod
     def _is_queryable_message_id(message_id) -> bool:
@@ -175,6 +305,51 @@ class SowingDiscord(Star):
             text = str(group_id_raw).strip()
             return text
 
+    def _build_evaluator(self, rule_names) -> Evaluator | None:
+        rules = []
+        for name in rule_names:
+            if not str(name).strip():
+                continue
+            rule = create_rule(name, self._rule_options)
+            if rule is None:
+                logger.warning(f"[QQ2TG] 未知或不可用的评估规则: {name}")
+                continue
+            rules.append(rule)
+        if not rules:
+            return None
+        return Evaluator(
+            rules,
+            rule_timeout=self._rule_options["rule_timeout"],
+            cache_ttl=self._rule_options["cache_ttl"],
+        )
+
+    @staticmethod
+    def _load_ml_scorer(config: dict):
+        model_path = str(config.get("evaluation_ml_model_path", "") or "").strip()
+        if not model_path:
+            return None
+        return load_scorer(
+            model_path,
+            max_batch=int(config.get("evaluation_ml_batch_size", 32)),
+            max_delay=float(config.get("evaluation_ml_batch_ms", 5)) / 1000,
+        )
+
+    def _evaluator_for_group(self, group_key: str) -> Evaluator | None:
+        if group_key in self._group_evaluators:
+            return self._group_evaluators[group_key]
+        return self._default_evaluator
+
+    def _waiting_time_for_group(self, group_key: str) -> float | None:
+        """群的规则链包含 good_emoji 时返回延长后的等待秒数，否则返回 None 使用默认值"""
+        evaluator = self._evaluator_for_group(group_key)
+        if evaluator is None or not any(
+            isinstance(rule, GoodEmojiRule) for rule in evaluator.rules
+        ):
+            return None
+        if self.evaluation_emoji_min_wait <= self.banshi_waiting_time:
+            return None
+        return self.evaluation_emoji_min_wait
+
     def _extract_event_text(self, event: AstrMessageEvent) -> str:
         msg_obj = getattr(event, "message_obj", None)
         raw_text = ""
@@ -271,26 +446,8 @@ class SowingDiscord(Star):
             return ""
         return text.lstrip("\ufeff\u200b\u2060\u00a0\t\r\n ")
 
-    def _extract_plain_text_from_segments(self, msg_segments) -> str:
-        if not isinstance(msg_segments, list) or not msg_segments:
-            return ""
-
-        parts = []
-        for seg in msg_segments:
-            if not isinstance(seg, dict):
-                return ""
-
-            if seg.get("type") != "text":
-                return ""
-
-            data = seg.get("data") or {}
-            text_value = data.get("text")
-            if not isinstance(text_value, str):
-                return ""
-            parts.append(text_value)
-
-        normalized = self._normalize_leading_text("".join(parts))
-        return normalized
+    def _extract_plain_text(self, segments: list[Segment]) -> str:
+        return self._normalize_leading_text(plain_text(segments))
 
     def _text_starts_with_any_prefix(self, text: str) -> bool:
         normalized = self._normalize_leading_text(text)
@@ -319,21 +476,49 @@ class SowingDiscord(Star):
 
         return None
 
-    @staticmethod
-    def _pick_file_name(file_data: dict) -> str:
-        raw_name = file_data.get("name") or ""
-        if isinstance(raw_name, str):
-            cleaned = raw_name.strip()
-            if cleaned and cleaned not in {"拓展名", "扩展名", "unknown", "file.bin"}:
-                return cleaned
+    def _snapshot_event_payload(self, event: AstrMessageEvent) -> dict | None:
+        """截取 OneBot 原始事件中的消息段、发送者、时间与群号，供转发时复用。"""
+        msg_obj = getattr(event, "message_obj", None)
+        raw_event = getattr(msg_obj, "raw_message", None)
+        if not isinstance(raw_event, dict):
+            return None
 
-        raw_file = file_data.get("file") or ""
-        if isinstance(raw_file, str):
-            cleaned = raw_file.strip()
-            if cleaned and not cleaned.startswith(("http://", "https://")):
-                return cleaned
+        segments = raw_event.get("message")
+        if not isinstance(segments, list) or not segments:
+            return None
+
+        message = []
+        for seg in segments:
+            if not isinstance(seg, dict):
+                return None
+            data = seg.get("data")
+            message.append(
+                {
+                    "type": seg.get("type"),
+                    "data": dict(data) if isinstance(data, dict) else {},
+                }
+            )
 
-        return "unknown_file"
+        sender = raw_event.get("sender")
+        return {
+            "message": message,
+            "sender": dict(sender) if isinstance(sender, dict) else {},
+            "time": raw_event.get("time"),
+            "group_id": raw_event.get("group_id"),
+        }
+
+    @staticmethod
+    def _is_complete_payload(payload) -> bool:
+        if not isinstance(payload, dict):
+            return False
+        raw_time = payload.get("time")
+        return (
+            isinstance(payload.get("message"), list)
+            and bool(payload.get("message"))
+            and isinstance(payload.get("sender"), dict)
+            and isinstance(raw_time, (int, float))
+            and raw_time > 0
+        )
 
     @staticmethod
     def _ensure_fname_in_url(file_url: str, file_name: str) -> str:
@@ -379,126 +564,95 @@ class SowingDiscord(Star):
         name = re.sub(r"[\\/:*?\"<>|]+", "_", name)
         return name[:180] or "unknown_file"
 
-    @staticmethod
-    def _find_first_nonempty_by_keys(obj, keys: set[str]) -> str:
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                if str(k).lower() in keys and isinstance(v, (str, int, float)):
-                    text = str(v).strip()
-                    if text:
-                        return text
-            for v in obj.values():
-                found = SowingDiscord._find_first_nonempty_by_keys(v, keys)
-                if found:
-                    return found
-            return ""
-
-        if isinstance(obj, list):
-            for item in obj:
-                found = SowingDiscord._find_first_nonempty_by_keys(item, keys)
-                if found:
-                    return found
-            return ""
-
-        return ""
-
-    @classmethod
-    def _parse_json_segment_summary(cls, data: dict) -> str:
-        raw = data.get("data")
-        obj = None
-
-        if isinstance(raw, dict):
-            obj = raw
-        elif isinstance(raw, str):
-            payload = raw.strip()
-            if payload:
-                candidates = [payload, html.unescape(payload)]
-                for candidate in candidates:
-                    try:
-                        parsed = json.loads(candidate)
-                        if isinstance(parsed, str):
-                            parsed = json.loads(parsed)
-                        if isinstance(parsed, (dict, list)):
-                            obj = parsed
-                            break
-                    except Exception:
-                        continue
-
-        if obj is None:
-            preview = str(raw).strip() if raw is not None else ""
-            if len(preview) > 160:
-                preview = preview[:157] + "..."
-            return f"[JSON卡片] {preview}" if preview else "[JSON卡片]"
-
-        title = cls._find_first_nonempty_by_keys(
-            obj, {"title", "prompt", "source", "name"}
-        )
-        desc = cls._find_first_nonempty_by_keys(
-            obj, {"desc", "description", "summary", "text", "content"}
-        )
-        url = cls._find_first_nonempty_by_keys(
-            obj,
-            {
-                "url",
-                "jumpurl",
-                "qqdocurl",
-                "newsurl",
-                "docurl",
-                "target",
-                "link",
-            },
-        )
-
-        parts = ["[JSON卡片]"]
-        if title:
-            parts.append(f"标题: {title}")
-        if desc and desc != title:
-            parts.append(f"摘要: {desc}")
-        if url:
-            parts.append(f"链接: {url}")
-
-        return " | ".join(parts)
-
-    async def _download_file_to_temp(self, file_url: str, file_name: str) -> str | None:
+    async def _download_file_to_temp(
+        self,
+        file_url: str,
+        file_name: str,
+        max_bytes: int | None = None,
+        expected_size: int | None = None,
+        probe: bool = False,
+    ) -> str | None:
+        max_bytes = max_bytes or self.telegram_upload_max_bytes
         safe_name = self._safe_file_name(file_name)
         tmp_dir = os.path.join(tempfile.gettempdir(), "astrbot_qq2tg_files")
         os.makedirs(tmp_dir, exist_ok=True)
         tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}_{safe_name}")
 
-        def _download() -> str | None:
-            req = urllib.request.Request(
+        try:
+            size = await self.downloader.download(
                 file_url,
-                headers={"User-Agent": "Mozilla/5.0"},
+                tmp_path,
+                max_bytes,
+                expected_size=expected_size,
+                probe=probe,
+            )
+        except DownloadTooLarge:
+            logger.info(
+                f"[QQ2TG] 文件超过上限({max_bytes // (1024 * 1024)}MB)，回退为链接: {safe_name}"
             )
-            with (
-                urllib.request.urlopen(req, timeout=25) as resp,
-                open(tmp_path, "wb") as f,
-            ):
-                total = 0
-                while True:
-                    chunk = resp.read(1024 * 64)
-                    if not chunk:
-                        break
-                    total += len(chunk)
-                    if total > self.telegram_upload_max_bytes:
-                        raise ValueError("file_too_large")
-                    f.write(chunk)
-
-            if os.path.getsize(tmp_path) <= 0:
-                return None
-            return tmp_path
-
-        try:
-            return await asyncio.to_thread(_download)
-        except ValueError as exc:
-            if str(exc) == "file_too_large":
-                logger.info(
-                    f"[QQ2TG] 文件超过上限({self.telegram_upload_max_mb}MB)，回退为链接: {safe_name}"
-                )
             return None
         except Exception as exc:
             logger.warning(f"[QQ2TG] 下载文件失败，回退为链接: {exc}")
             return None
+        if size <= 0:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        return tmp_path
+
+    def _archive_saves_assets(self) -> bool:
+        return bool(
+            self.enable_markdown_archive
+            and self.markdown_archive
+            and self.markdown_archive.save_assets
+        )
+
+    async def _prefetch_attachments(
+        self,
+        client,
+        source_group_id_raw,
+        segments: list[Segment],
+        attachments: AttachmentBroker,
+        upload: bool,
+        archive: bool,
+    ):
+        """并发解析文件链接并在后台开始下载本条目的全部附件，渲染时按顺序取用"""
+        archive_assets = archive and self._archive_saves_assets()
+        file_segments = [
+            seg
+            for seg in segments
+            if seg.kind == "file" and not self._known_asset_path(seg)
+        ]
+        if file_segments and (
+            archive_assets or (upload and self.telegram_upload_files)
+        ):
+            await asyncio.gather(
+                *(
+                    self._resolve_segment_url(client, source_group_id_raw, seg)
+                    for seg in file_segments
+                )
+            )
+            for seg in file_segments:
+                attachments.prefetch(seg.url, seg.name, seg.size, probe=True)
+        if archive_assets:
+            for seg in segments:
+                if seg.kind == "image" and seg.url and not self._known_asset_path(seg):
+                    attachments.prefetch(seg.url, self._image_name(seg.url))
+
+    def _known_asset_path(self, seg: Segment) -> str | None:
+        """附件已在归档的 blob 存储中时返回其路径，可直接复用而无需下载"""
+        if not self._archive_saves_assets():
+            return None
+        return self.markdown_archive.blob_store.lookup(asset_fingerprints(seg))
+
+    def _new_attachment_broker(self) -> AttachmentBroker:
+        """按各通道中最大的大小上限创建本条消息的附件中转"""
+        limits = [self.telegram_upload_max_bytes if self.telegram_upload_files else 0]
+        if self._archive_saves_assets():
+            limits.append(self.markdown_archive.asset_max_bytes)
+        return AttachmentBroker(self._download_file_to_temp, max_bytes=max(limits))
 
     async def _resolve_file_url(self, client, source_group_id, file_data: dict) -> str:
         direct_url = file_data.get("url") or file_data.get("file")
@@ -538,44 +692,22 @@ class SowingDiscord(Star):
         return ""
 
     def _render_message_text(self, message_segments) -> str:
-        if not isinstance(message_segments, list):
-            return str(message_segments)
-
-        parts = []
-        for seg in message_segments:
-            if not isinstance(seg, dict):
-                parts.append(str(seg))
-                continue
-
-            seg_type = seg.get("type")
-            data = seg.get("data", {})
-
-            if seg_type == "text":
-                parts.append(data.get("text", ""))
-            elif seg_type == "at":
-                parts.append(f"@{data.get('qq', 'unknown')}")
-            elif seg_type == "image":
-                parts.append("[图片]")
-            elif seg_type == "face":
-                parts.append("[表情]")
-            elif seg_type == "reply":
-                parts.append("[回复]")
-            elif seg_type == "file":
-                file_name = data.get("name") or data.get("file") or "unknown"
-                parts.append(f"[文件:{file_name}]")
-            elif seg_type == "record":
-                parts.append("[语音]")
-            elif seg_type == "video":
-                parts.append("[视频]")
-            elif seg_type == "forward":
-                parts.append("[合并转发]")
-            elif seg_type == "json":
-                parts.append(self._parse_json_segment_summary(data))
-            else:
-                parts.append(f"[{seg_type or 'unknown'}]")
-
-        text = " ".join([p for p in parts if p]).strip()
-        return text or "[空消息]"
+        return render_text(parse_segments(message_segments))
+
+    async def _resolve_segment_url(self, client, source_group_id, seg: Segment) -> str:
+        """解析文件段的下载链接(已补 fname)，结果缓存在段上，各输出通道只解析一次"""
+        if seg.url is None:
+            file_url = await self._resolve_file_url(
+                client=client,
+                source_group_id=source_group_id,
+                file_data=seg.data,
+            )
+            seg.url = (
+                self._ensure_fname_in_url(file_url, seg.name)
+                if is_http_url(file_url)
+                else ""
+            )
+        return seg.url
 
     @staticmethod
     def _format_msg_time(raw_time, fallback: str = "") -> str:
@@ -590,30 +722,36 @@ class SowingDiscord(Star):
             return raw_time.strip()
         return fallback or "未知时间"
 
-    @staticmethod
-    def _extract_forward_id(seg_data: dict) -> str:
-        for key in ("id", "resid", "forward_id"):
-            value = seg_data.get(key)
-            if value is None:
-                continue
-            text = str(value).strip()
-            if text:
-                return text
-        return ""
-
     async def _call_get_forward_msg(self, client, forward_id: str) -> list:
+        """获取合并转发内容，结果按 forward id 缓存，同一 id 并发请求只查询一次。"""
         if not forward_id:
             return []
 
+        cached = self._forward_msg_cache.get(forward_id)
+        if cached is not None:
+            return cached
+
+        inflight = self._forward_msg_inflight.get(forward_id)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._forward_msg_inflight[forward_id] = future
+        messages = []
         try:
-            resp = await client.api.call_action("get_forward_msg", id=forward_id)
+            async with self._forward_fetch_semaphore:
+                resp = await client.api.call_action("get_forward_msg", id=forward_id)
             if isinstance(resp, dict) and isinstance(resp.get("messages"), list):
-                return resp["messages"]
+                messages = resp["messages"]
+                self._forward_msg_cache.set(forward_id, messages)
         except Exception as exc:
             logger.warning(
                 f"[QQ2TG] get_forward_msg 失败, id={forward_id}, error={exc}"
             )
-        return []
+        finally:
+            self._forward_msg_inflight.pop(forward_id, None)
+            future.set_result(messages)
+        return messages
 
     @staticmethod
     def _extract_node_segments(node: dict):
@@ -655,130 +793,193 @@ class SowingDiscord(Star):
         msg_time_str = self._format_msg_time(node.get("time"), fallback=fallback_time)
         return sender_name, sender_id, msg_time_str
 
-    async def _expand_segments_to_entries(
+    @staticmethod
+    def _make_entry(
+        segments: list[Segment], sender_name: str, sender_id, msg_time_str: str
+    ):
+        return {
+            "msg_content": [seg.raw for seg in segments],
+            "segments": segments,
+            "sender_name": sender_name,
+            "sender_id": sender_id,
+            "msg_time_str": msg_time_str,
+        }
+
+    @classmethod
+    def _make_text_entry(cls, text: str, sender_name: str, sender_id, msg_time_str):
+        return cls._make_entry(
+            parse_segments(text),
+            sender_name,
+            sender_id,
+            msg_time_str,
+        )
+
+    def _prefetch_forward_msgs(self, client, segment_lists):
+        """后台预取同一层的合并转发内容，流式展开到达时直接命中缓存"""
+        for segments in segment_lists:
+            for seg in segments:
+                if seg.kind != "forward":
+                    continue
+                forward_id = seg.forward_id
+                if (
+                    not forward_id
+                    or forward_id in self._forward_msg_inflight
+                    or self._forward_msg_cache.get(forward_id) is not None
+                ):
+                    continue
+                task = asyncio.create_task(
+                    self._call_get_forward_msg(client, forward_id)
+                )
+                self._forward_prefetch_tasks.add(task)
+                task.add_done_callback(self._forward_prefetch_tasks.discard)
+
+    async def _iter_forward_segment(
         self,
         client,
-        msg_segments,
+        forward_id: str,
         sender_name: str,
         sender_id,
         msg_time_str: str,
-        depth: int = 0,
+        depth: int,
     ):
-        if depth >= 4:
-            return [
-                {
-                    "msg_content": [
-                        {
-                            "type": "text",
-                            "data": {"text": "[嵌套合并转发层数过多]"},
-                        }
-                    ],
-                    "sender_name": sender_name,
-                    "sender_id": sender_id,
-                    "msg_time_str": msg_time_str,
-                }
-            ]
+        child_nodes = await self._call_get_forward_msg(client, forward_id)
+        if not child_nodes:
+            yield self._make_text_entry(
+                f"[合并转发:{forward_id or 'unknown'}]",
+                sender_name,
+                sender_id,
+                msg_time_str,
+            )
+            return
 
-        if not isinstance(msg_segments, list):
-            msg_segments = [{"type": "text", "data": {"text": str(msg_segments)}}]
+        nodes = []
+        for node in child_nodes:
+            if not isinstance(node, dict):
+                continue
+            node_sender_name, node_sender_id, node_time_str = self._extract_node_meta(
+                node=node,
+                fallback_name=sender_name,
+                fallback_id=sender_id,
+                fallback_time=msg_time_str,
+            )
+            nodes.append(
+                (
+                    node_sender_name,
+                    node_sender_id,
+                    node_time_str,
+                    parse_segments(self._extract_node_segments(node)),
+                )
+            )
 
-        entries = []
-        normal_buffer = []
+        # 下一层的合并转发提前并发拉取 (受 _forward_fetch_semaphore 限制)，本层仍按节点
+        # 顺序逐个输出；子节点位于第 4 层时只输出层数过多的占位，不必拉取
+        if depth + 1 < 4:
+            self._prefetch_forward_msgs(client, (node[3] for node in nodes))
 
-        def flush_normal_buffer():
-            if not normal_buffer:
-                return
-            entries.append(
-                {
-                    "msg_content": list(normal_buffer),
-                    "sender_name": sender_name,
-                    "sender_id": sender_id,
-                    "msg_time_str": msg_time_str,
-                }
-            )
-            normal_buffer.clear()
+        for node_sender_name, node_sender_id, node_time_str, node_segments in nodes:
+            if not node_segments:
+                yield self._make_text_entry(
+                    "[空消息]", node_sender_name, node_sender_id, node_time_str
+                )
+                continue
 
-        for seg in msg_segments:
-            if (
-                isinstance(seg, dict)
-                and seg.get("type") == "forward"
-                and isinstance(seg.get("data"), dict)
+            async for entry in self._iter_segment_entries(
+                client=client,
+                segments=node_segments,
+                sender_name=node_sender_name,
+                sender_id=node_sender_id,
+                msg_time_str=node_time_str,
+                depth=depth + 1,
             ):
-                flush_normal_buffer()
-
-                forward_id = self._extract_forward_id(seg.get("data", {}))
-                child_nodes = await self._call_get_forward_msg(client, forward_id)
-                if not child_nodes:
-                    entries.append(
-                        {
-                            "msg_content": [
-                                {
-                                    "type": "text",
-                                    "data": {
-                                        "text": f"[合并转发:{forward_id or 'unknown'}]"
-                                    },
-                                }
-                            ],
-                            "sender_name": sender_name,
-                            "sender_id": sender_id,
-                            "msg_time_str": msg_time_str,
-                        }
-                    )
-                    continue
+                yield entry
 
-                for node in child_nodes:
-                    if not isinstance(node, dict):
-                        continue
+    async def _iter_segment_entries(
+        self,
+        client,
+        segments: list[Segment],
+        sender_name: str,
+        sender_id,
+        msg_time_str: str,
+        depth: int = 0,
+    ):
+        if depth >= 4:
+            yield self._make_text_entry(
+                "[嵌套合并转发层数过多]", sender_name, sender_id, msg_time_str
+            )
+            return
 
-                    node_sender_name, node_sender_id, node_time_str = (
-                        self._extract_node_meta(
-                            node=node,
-                            fallback_name=sender_name,
-                            fallback_id=sender_id,
-                            fallback_time=msg_time_str,
-                        )
-                    )
-                    node_segments = self._extract_node_segments(node)
-
-                    if not node_segments:
-                        entries.append(
-                            {
-                                "msg_content": [
-                                    {"type": "text", "data": {"text": "[空消息]"}}
-                                ],
-                                "sender_name": node_sender_name,
-                                "sender_id": node_sender_id,
-                                "msg_time_str": node_time_str,
-                            }
-                        )
-                        continue
+        if depth == 0:
+            self._prefetch_forward_msgs(client, (segments,))
 
-                    nested_entries = await self._expand_segments_to_entries(
-                        client=client,
-                        msg_segments=node_segments,
-                        sender_name=node_sender_name,
-                        sender_id=node_sender_id,
-                        msg_time_str=node_time_str,
-                        depth=depth + 1,
+        yielded = False
+        normal_buffer = []
+
+        for seg in segments:
+            if seg.kind == "forward":
+                if normal_buffer:
+                    yield self._make_entry(
+                        normal_buffer, sender_name, sender_id, msg_time_str
                     )
-                    entries.extend(nested_entries)
+                    yielded = True
+                    normal_buffer = []
+                async for entry in self._iter_forward_segment(
+                    client,
+                    seg.forward_id,
+                    sender_name,
+                    sender_id,
+                    msg_time_str,
+                    depth,
+                ):
+                    yield entry
+                    yielded = True
                 continue
 
             normal_buffer.append(seg)
 
-        flush_normal_buffer()
+        if normal_buffer:
+            yield self._make_entry(normal_buffer, sender_name, sender_id, msg_time_str)
+            yielded = True
 
-        if entries:
-            return entries
+        if not yielded:
+            yield self._make_text_entry(
+                "[空消息]", sender_name, sender_id, msg_time_str
+            )
 
-        return [
-            {
-                "msg_content": [{"type": "text", "data": {"text": "[空消息]"}}],
-                "sender_name": sender_name,
-                "sender_id": sender_id,
-                "msg_time_str": msg_time_str,
-            }
-        ]
+    async def _iter_expanded_entries(
+        self,
+        client,
+        segments: list[Segment],
+        sender_name: str,
+        sender_id,
+        msg_time_str: str,
+    ):
+        """流式展开消息，逐条产出 entry；超出节点数/字节数预算时输出截断标记并停止。"""
+        budget = ExpandBudget(
+            max_nodes=self.forward_expand_max_nodes,
+            max_bytes=self.forward_expand_max_bytes,
+        )
+        async with aclosing(
+            self._iter_segment_entries(
+                client=client,
+                segments=segments,
+                sender_name=sender_name,
+                sender_id=sender_id,
+                msg_time_str=msg_time_str,
+            )
+        ) as entries:
+            async for entry in entries:
+                if not budget.consume(entry["msg_content"]):
+                    logger.warning(
+                        f"[QQ2TG] 合并转发超出展开预算，已截断: nodes={budget.nodes}, bytes={budget.bytes}"
+                    )
+                    yield self._make_text_entry(
+                        f"[合并转发内容过多，已截断，仅保留前 {budget.nodes} 条]",
+                        sender_name,
+                        sender_id,
+                        msg_time_str,
+                    )
+                    return
+                yield entry
 
     @staticmethod
     def _escape_markdown(text: str) -> str:
@@ -795,7 +996,7 @@ class SowingDiscord(Star):
 
     async def _build_forward_chain(
         self,
-        msg_content,
+        segments: list[Segment],
         source_group_name: str,
         source_group_id,
         source_group_id_raw,
@@ -803,6 +1004,7 @@ class SowingDiscord(Star):
         sender_id,
         msg_time_str: str,
         client=None,
+        attachments: AttachmentBroker | None = None,
     ):
         safe_group = self._escape_markdown(str(source_group_name))
         safe_group_id = self._escape_markdown(str(source_group_id))
@@ -818,92 +1020,53 @@ class SowingDiscord(Star):
         )
 
         chains = [Comp.Plain(header_markdown)]
-        temp_files = []
         text_parts = []
 
-        if not isinstance(msg_content, list):
-            msg_content = [
-                {
-                    "type": "text",
-                    "data": {"text": str(msg_content)},
-                }
-            ]
-
-        for seg in msg_content:
-            if not isinstance(seg, dict):
-                text_parts.append(str(seg))
-                continue
-
-            seg_type = seg.get("type")
-            data = seg.get("data", {})
-
-            if seg_type == "text":
-                txt = data.get("text", "")
-                if txt:
-                    text_parts.append(txt)
-                continue
-
-            if seg_type == "at":
-                text_parts.append(f"@{data.get('qq', 'unknown')}")
-                continue
-
-            if seg_type == "reply":
-                text_parts.append("[回复]")
-                continue
-
-            if seg_type == "image":
-                image_url = data.get("url") or data.get("file")
-                if isinstance(image_url, str) and image_url.startswith(
-                    ("http://", "https://")
-                ):
-                    chains.append(Comp.Image.fromURL(image_url))
+        for seg in segments:
+            if seg.kind == "image" and seg.url:
+                # 归档需要下载图片时共用同一份本地文件，否则交给平台按 URL 拉取
+                local_path = self._known_asset_path(seg)
+                if not local_path and attachments and self._archive_saves_assets():
+                    local_path = await attachments.fetch(
+                        seg.url, self._image_name(seg.url)
+                    )
+                if local_path:
+                    chains.append(Comp.Image.fromFileSystem(local_path))
                 else:
-                    text_parts.append("[图片]")
+                    chains.append(Comp.Image.fromURL(seg.url))
                 continue
 
-            if seg_type == "file":
-                file_url = await self._resolve_file_url(
-                    client=client,
-                    source_group_id=source_group_id_raw,
-                    file_data=data,
-                )
-                file_name = self._pick_file_name(data)
-                if isinstance(file_url, str) and file_url.startswith(
-                    ("http://", "https://")
+            if seg.kind == "file":
+                known_path = self._known_asset_path(seg)
+                if (
+                    self.telegram_upload_files
+                    and known_path
+                    and AttachmentBroker.fits(
+                        known_path, self.telegram_upload_max_bytes
+                    )
                 ):
-                    fixed_url = self._ensure_fname_in_url(file_url, file_name)
-                    if self.telegram_upload_files:
-                        local_path = await self._download_file_to_temp(
-                            fixed_url, file_name
+                    chains.append(Comp.File(file=known_path, name=seg.name))
+                    continue
+                file_url = await self._resolve_segment_url(
+                    client, source_group_id_raw, seg
+                )
+                if file_url and self.telegram_upload_files and attachments:
+                    local_path = None
+                    if not seg.size or seg.size <= self.telegram_upload_max_bytes:
+                        local_path = await attachments.fetch(
+                            file_url, seg.name, seg.size, probe=True
                         )
-                        if local_path:
-                            temp_files.append(local_path)
-                            chains.append(Comp.File(file=local_path, name=file_name))
-                        else:
-                            text_parts.append(f"[文件:{file_name}] {fixed_url}")
-                    else:
-                        text_parts.append(f"[文件:{file_name}] {fixed_url}")
-                else:
-                    text_parts.append(f"[文件:{file_name}]")
-                continue
-
-            if seg_type == "video":
-                text_parts.append("[视频]")
-                continue
-
-            if seg_type == "record":
-                text_parts.append("[语音]")
-                continue
-
-            if seg_type == "face":
-                text_parts.append("[表情]")
-                continue
-
-            if seg_type == "json":
-                text_parts.append(self._parse_json_segment_summary(data))
+                    if attachments.fits(local_path, self.telegram_upload_max_bytes):
+                        chains.append(Comp.File(file=local_path, name=seg.name))
+                        continue
+                    if local_path:
+                        logger.info(
+                            f"[QQ2TG] 文件超过上限({self.telegram_upload_max_mb}MB)，回退为链接: {seg.name}"
+                        )
+                text_parts.append(f"{seg.text} {file_url}" if file_url else seg.text)
                 continue
 
-            text_parts.append(f"[{seg_type or 'unknown'}]")
+            text_parts.append(seg.text)
 
         body = " ".join([x for x in text_parts if x]).strip()
         if body:
@@ -911,7 +1074,7 @@ class SowingDiscord(Star):
         elif len(chains) == 1:
             chains.append(Comp.Plain("[空消息]"))
 
-        return chains, temp_files
+        return chains
 
     @staticmethod
     def _archive_day_str(raw_time, fallback: str = "") -> str:
@@ -930,13 +1093,65 @@ class SowingDiscord(Star):
 
         return datetime.now().strftime("%Y-%m-%d")
 
+    @staticmethod
+    def _image_name(image_url: str) -> str:
+        return MarkdownArchive.guess_name_from_url(image_url, "image.jpg")
+
+    async def _archive_attachment(
+        self,
+        attachments,
+        day_str: str,
+        category: str,
+        seg: Segment,
+        url: str,
+        file_name: str,
+        group_id: str = "",
+    ) -> str | None:
+        """把附件存入归档目录：已归档过的直接链接，否则复用附件中转下载的本地文件"""
+        if not self._archive_saves_assets():
+            return None
+        fingerprints = asset_fingerprints(seg)
+        local_rel = await self.markdown_archive.link_known_asset(
+            day_str, category, fingerprints, file_name, group_id
+        )
+        if local_rel or not url:
+            return local_rel
+        if attachments is None:
+            return await self.markdown_archive.save_url_asset(
+                day_str=day_str,
+                category=category,
+                url=url,
+                preferred_name=file_name,
+                fingerprints=fingerprints,
+                group_id=group_id,
+            )
+        expected_size = seg.size
+        if expected_size and expected_size > self.markdown_archive.asset_max_bytes:
+            logger.info(
+                f"[QQ2TG][Archive] 附件超过上限({self.archive_asset_max_mb}MB)，保留链接: {file_name}"
+            )
+            return None
+        local_path = await attachments.fetch(
+            url, file_name, expected_size, probe=category == "files"
+        )
+        if not local_path:
+            return None
+        return await self.markdown_archive.import_local_asset(
+            day_str=day_str,
+            category=category,
+            src_path=local_path,
+            preferred_name=file_name,
+            fingerprints=fingerprints,
+            group_id=group_id,
+        )
+
     @staticmethod
     def _md_inline(text) -> str:
         return str(text).replace("`", "'")
 
     async def _build_markdown_block(
         self,
-        msg_content,
+        segments: list[Segment],
         source_group_name: str,
         source_group_id,
         source_group_id_raw,
@@ -947,115 +1162,62 @@ class SowingDiscord(Star):
         message_id,
         ignored: bool = False,
         client=None,
+        attachments: AttachmentBroker | None = None,
+        rejected_by: str = "",
     ) -> str:
-        if not isinstance(msg_content, list):
-            msg_content = [
-                {
-                    "type": "text",
-                    "data": {"text": str(msg_content)},
-                }
-            ]
-
-        text_parts = []
         attachment_parts = []
 
-        for seg in msg_content:
-            if not isinstance(seg, dict):
-                text_parts.append(str(seg))
-                continue
-
-            seg_type = seg.get("type")
-            data = seg.get("data", {})
-
-            if seg_type == "text":
-                txt = data.get("text", "")
-                if txt:
-                    text_parts.append(txt)
-                continue
-
-            if seg_type == "at":
-                text_parts.append(f"@{data.get('qq', 'unknown')}")
-                continue
-
-            if seg_type == "reply":
-                text_parts.append("[回复]")
-                continue
-
-            if seg_type == "json":
-                text_parts.append(self._parse_json_segment_summary(data))
-                continue
-
-            if seg_type == "image":
-                image_url = data.get("url") or data.get("file")
-                if isinstance(image_url, str) and image_url.startswith(
-                    ("http://", "https://")
-                ):
-                    image_name = (
-                        self.markdown_archive.guess_name_from_url(
-                            image_url, "image.jpg"
-                        )
-                        if self.markdown_archive
-                        else "image.jpg"
-                    )
-                    local_rel = None
-                    if self.markdown_archive:
-                        local_rel = await self.markdown_archive.save_url_asset(
-                            day_str=day_str,
-                            category="photos",
-                            url=image_url,
-                            preferred_name=image_name,
-                        )
+        for seg in segments:
+            if seg.kind == "image" and seg.url:
+                image_url = seg.url
+                image_name = self._image_name(image_url)
+                local_rel = await self._archive_attachment(
+                    attachments,
+                    day_str,
+                    "photos",
+                    seg,
+                    image_url,
+                    image_name,
+                    source_group_id,
+                )
 
-                    if local_rel:
-                        attachment_parts.append(f"- 图片: ![{image_name}]({local_rel})")
-                    else:
-                        attachment_parts.append(f"- 图片: {image_url}")
+                if local_rel:
+                    attachment_parts.append(f"- 图片: ![{image_name}]({local_rel})")
                 else:
-                    text_parts.append("[图片]")
+                    attachment_parts.append(f"- 图片: {image_url}")
                 continue
 
-            if seg_type == "file":
-                file_url = await self._resolve_file_url(
-                    client=client,
-                    source_group_id=source_group_id_raw,
-                    file_data=data,
+            if seg.kind == "file":
+                file_name = seg.name
+                # 已归档过的文件直接链接，无需再解析下载链接
+                local_rel = await self._archive_attachment(
+                    attachments, day_str, "files", seg, "", file_name, source_group_id
                 )
-                file_name = self._pick_file_name(data)
-                if isinstance(file_url, str) and file_url.startswith(
-                    ("http://", "https://")
-                ):
-                    fixed_url = self._ensure_fname_in_url(file_url, file_name)
-                    local_rel = None
-                    if self.markdown_archive:
-                        local_rel = await self.markdown_archive.save_url_asset(
-                            day_str=day_str,
-                            category="files",
-                            url=fixed_url,
-                            preferred_name=file_name,
-                        )
-                    if local_rel:
-                        attachment_parts.append(f"- 文件: [{file_name}]({local_rel})")
-                    else:
-                        attachment_parts.append(f"- 文件: [{file_name}]({fixed_url})")
+                file_url = ""
+                if not local_rel:
+                    file_url = await self._resolve_segment_url(
+                        client, source_group_id_raw, seg
+                    )
+                if file_url:
+                    local_rel = await self._archive_attachment(
+                        attachments,
+                        day_str,
+                        "files",
+                        seg,
+                        file_url,
+                        file_name,
+                        source_group_id,
+                    )
+                if local_rel:
+                    attachment_parts.append(f"- 文件: [{file_name}]({local_rel})")
+                elif file_url:
+                    attachment_parts.append(f"- 文件: [{file_name}]({file_url})")
                 else:
                     attachment_parts.append(f"- 文件: {file_name}")
                 continue
 
-            if seg_type == "video":
-                text_parts.append("[视频]")
-                continue
-
-            if seg_type == "record":
-                text_parts.append("[语音]")
-                continue
-
-            if seg_type == "face":
-                text_parts.append("[表情]")
-                continue
-
-            text_parts.append(f"[{seg_type or 'unknown'}]")
-
-        body = " ".join([x for x in text_parts if x]).strip() or "[空消息]"
+        # 正文与 ml_score 打分的输入共用同一份拼接逻辑，训练数据与运行时特征保持一致
+        body = message_inputs(segments)[0] or "[空消息]"
 
         heading = f"## {self._md_inline(msg_time_str)}"
         if ignored:
@@ -1066,9 +1228,11 @@ class SowingDiscord(Star):
             f"- 来源群: `{self._md_inline(source_group_name)}` (`{self._md_inline(source_group_id)}`)",
             f"- 发送者: `{self._md_inline(sender_name)}` (`{self._md_inline(sender_id)}`)",
             f"- 消息ID: `{self._md_inline(message_id)}`",
-            "",
-            body,
         ]
+        if rejected_by:
+            # 训练 ml_score 时据此区分评估规则拦下的消息与群前缀屏蔽的消息
+            lines.append(f"- 评估未通过: `{self._md_inline(rejected_by)}`")
+        lines.extend(["", body])
 
         if attachment_parts:
             lines.extend(["", "附件:"])
@@ -1089,15 +1253,58 @@ class SowingDiscord(Star):
         archive_status = "开启" if self.enable_markdown_archive else "关闭"
         tg_status = "开启" if self.enable_telegram_forward else "关闭"
         target_count = len(self.telegram_target_unified_origins)
+        dc_status = "开启" if self.enable_discord_forward else "关闭"
+        dc_target_count = len(self.discord_target_unified_origins)
+        state_names = {"closed": "正常", "open": "熔断", "half_open": "探测中"}
+        target_lines = []
+        for target_umo in (
+            self.telegram_target_unified_origins + self.discord_target_unified_origins
+        ):
+            breaker = self.target_breakers.get(target_umo)
+            state = breaker.state
+            line = f"  - {target_umo}: {state_names.get(state, state)}"
+            if state == "open":
+                line += f" ({int(breaker.retry_in())}s 后探测)"
+            if breaker.failures:
+                line += f", 连续失败 {breaker.failures} 次"
+            pending = self.delivery_retry_queue.pending_count(target_umo)
+            if pending:
+                line += f", 待重试 {pending} 条"
+            target_lines.append(line)
         yield event.plain_result(
             "当前输出通道状态:\n"
             f"- Telegram: {tg_status} (目标数: {target_count})\n"
+            f"- Discord: {dc_status} (目标数: {dc_target_count})\n"
             f"- Markdown归档: {archive_status}\n"
             f"- 归档目录: {self.archive_root}\n"
             f"- 附件保存: {'开启' if self.archive_save_assets else '关闭'}\n"
-            f"- 抑制前缀: {self.qq_block_prefixes or '未配置(已关闭)'}"
+            f"- 抑制前缀: {self.qq_block_prefixes or '未配置(已关闭)'}\n"
+            "- 目标状态:\n" + ("\n".join(target_lines) or "  - 无")
         )
 
+    @filter.command("qq2tg_combine_day")
+    async def qq2tg_combine_day(self, event: AstrMessageEvent, day: str = ""):
+        if not self.enable_markdown_archive or not self.markdown_archive:
+            yield event.plain_result("Markdown 归档未开启。")
+            return
+        day_str = (day or "").strip() or datetime.now().strftime("%Y-%m-%d")
+        try:
+            datetime.strptime(day_str, "%Y-%m-%d")
+        except ValueError:
+            yield event.plain_result("日期格式应为 YYYY-MM-DD。")
+            return
+
+        try:
+            target_file = await self.markdown_archive.build_combined_day(day_str)
+        except Exception as exc:
+            logger.error(f"[QQ2TG][Archive] 生成合并视图失败: {exc}")
+            yield event.plain_result(f"生成合并视图失败: {exc}")
+            return
+        if not target_file:
+            yield event.plain_result(f"{day_str} 没有归档内容。")
+            return
+        yield event.plain_result(f"{day_str} 的归档:\n{target_file}")
+
     @filter.command("qq2tg_bind_target")
     async def qq2tg_bind_target(self, event: AstrMessageEvent):
         platform = event.get_platform_name()
@@ -1138,16 +1345,29 @@ class SowingDiscord(Star):
     @filter.platform_adapter_type(PlatformAdapterType.AIOCQHTTP)
     async def handle_message(self, event: AstrMessageEvent):
         group_id = event.message_obj.group_id
-        msg_id = event.message_obj.message_id
-        is_source = self._is_source_group(group_id)
         group_key = self._group_state_key(group_id)
+        is_source = group_key in self._source_group_keys
+
+        if self._qq_client is None:
+            self._bind_qq_client(event.bot)
+        self._ensure_forward_worker()
 
+        raw_event = getattr(event.message_obj, "raw_message", None)
+        if isinstance(raw_event, dict) and raw_event.get("post_type") == "notice":
+            self._handle_notice(raw_event)
+            return None
+
+        # 非来源群消息直接返回，全程不触碰磁盘
+        if not is_source:
+            return None
+
+        msg_id = event.message_obj.message_id
         logger.info(
-            f"[QQ2TG][ID:{self.instance_id}] 收到 QQ 消息 id={msg_id}, group={group_id}, in_source={is_source}"
+            f"[QQ2TG][ID:{self.instance_id}] 收到 QQ 消息 id={msg_id}, group={group_id}"
         )
 
         ignore_forward = False
-        if is_source and group_key:
+        if group_key:
             hit_prefix = self._event_starts_with_any_prefix(event)
             if hit_prefix:
                 self._group_prefix_blocked.add(group_key)
@@ -1161,288 +1381,578 @@ class SowingDiscord(Star):
                     f"[QQ2TG] 群 {group_key} 仍处于抑制状态，等待下一条非抑制前缀纯文本。"
                 )
 
-        if is_source:
-            if self._is_queryable_message_id(msg_id):
-                await self.local_cache.add_cache(
-                    msg_id,
-                    group_id=group_id,
-                    ignore_forward=ignore_forward,
+        if self._is_queryable_message_id(msg_id):
+            payload = (
+                self._snapshot_event_payload(event)
+                if self.capture_message_payload
+                else None
+            )
+            self.reaction_counter.track(msg_id)
+            await self.local_cache.add_cache(
+                msg_id,
+                group_id=group_id,
+                ignore_forward=ignore_forward,
+                payload=payload,
+                wait=self._waiting_time_for_group(group_key),
+            )
+            if ignore_forward:
+                logger.info(
+                    f"[QQ2TG] 群 {group_key} 处于抑制状态，消息仅归档不转发: {msg_id}"
                 )
-                if ignore_forward:
-                    logger.info(
-                        f"[QQ2TG] 群 {group_key} 处于抑制状态，消息仅归档不转发: {msg_id}"
-                    )
-            else:
-                logger.debug(f"[QQ2TG] 跳过不可查询消息ID: {msg_id}")
-
-        has_pending = await self.local_cache.has_pending_messages()
-        if has_pending and not self.forward_lock.locked():
-            await self._execute_forward_and_cool(event)
+        else:
+            logger.debug(f"[QQ2TG] 跳过不可查询消息ID: {msg_id}")
 
-        if self.block_source_messages and is_source:
+        if self.block_source_messages:
             return MessageEventResult(None)
         return None
 
-    async def _execute_forward_and_cool(self, event: AstrMessageEvent):
-        client = event.bot
-        self._forward_task = asyncio.current_task()
+    def _handle_notice(self, raw_event: dict):
+        if self.reaction_counter.handle_notice(raw_event):
+            return
+        notice_type = raw_event.get("notice_type")
+        sub_type = raw_event.get("sub_type")
+        if notice_type == "group_name_change" or (
+            notice_type == "notify" and sub_type == "group_name"
+        ):
+            group_id = raw_event.get("group_id")
+            new_name = raw_event.get("name_new") or raw_event.get("name")
+            if new_name:
+                self.group_info_cache.update_name(group_id, new_name)
+            else:
+                self.group_info_cache.invalidate(group_id)
+            logger.info(f"[QQ2TG] 群 {group_id} 名称变更，已刷新群信息缓存")
+
+    def _bind_qq_client(self, client):
+        if client is None:
+            return
+        first_bind = self._qq_client is None
+        self._qq_client = client
+        self._qq_client_ready.set()
+
+        if first_bind and self.banshi_group_list:
+            try:
+                self._group_warm_task = asyncio.get_running_loop().create_task(
+                    self.group_info_cache.warm(client, self.banshi_group_list)
+                )
+            except RuntimeError:
+                pass
+
+    def _resolve_qq_client(self):
+        """优先使用事件中拿到的 client，否则尝试从已加载的 aiocqhttp 平台获取。"""
+        if self._qq_client is not None:
+            return self._qq_client
 
         try:
-            cleaned = await self.local_cache._cleanup_expired_cache()
-            if cleaned:
-                logger.info(
-                    f"[QQ2TG][ID:{self.instance_id}] 清理过期缓存: {cleaned} 条"
+            platform = self.context.get_platform(PlatformAdapterType.AIOCQHTTP)
+        except Exception:
+            platform = None
+        if platform is None:
+            return None
+
+        get_client = getattr(platform, "get_client", None)
+        client = (
+            get_client() if callable(get_client) else getattr(platform, "bot", None)
+        )
+        self._bind_qq_client(client)
+        return self._qq_client
+
+    def _ensure_forward_worker(self):
+        if self._forward_task is not None and not self._forward_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 尚无事件循环时，等第一条消息到达再启动
+            return
+        self._forward_task = loop.create_task(self._forward_worker())
+        self.delivery_retry_queue.start()
+
+    async def _forward_worker(self):
+        """常驻调度任务：等待消息成熟后按来源群分派到各自的转发通道。
+
+        启动时会先排空缓存中的积压。同一个群的消息在同一通道内按成熟顺序串行处理，
+        不同群之间并行，最多同时处理 ``forward_max_parallel_groups`` 个群。
+        """
+        logger.info(
+            f"[QQ2TG][ID:{self.instance_id}] 转发任务已启动，积压消息: {self.local_cache.pending_count}"
+        )
+        try:
+            while True:
+                await self.local_cache.wait_for_mature()
+
+                client = self._resolve_qq_client()
+                if client is None:
+                    self._qq_client_ready.clear()
+                    try:
+                        await asyncio.wait_for(self._qq_client_ready.wait(), timeout=30)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                cleaned = await self.local_cache._cleanup_expired_cache()
+                if cleaned:
+                    logger.info(
+                        f"[QQ2TG][ID:{self.instance_id}] 清理过期缓存: {cleaned} 条"
+                    )
+
+                for msg_id in self.local_cache.pop_mature_messages():
+                    group_id = await self.local_cache.get_message_group_id(msg_id)
+                    self._dispatch_to_lane(self._group_state_key(group_id), msg_id)
+        except asyncio.CancelledError:
+            logger.warning(f"[QQ2TG][ID:{self.instance_id}] 转发任务被取消")
+            raise
+        finally:
+            for lane_task in self._forward_lanes.values():
+                lane_task.cancel()
+            if self._forward_lanes:
+                await asyncio.gather(
+                    *self._forward_lanes.values(), return_exceptions=True
                 )
+            self._forward_lanes.clear()
+            self._lane_queues.clear()
+
+    def _dispatch_to_lane(self, lane_key: str, msg_id):
+        queue = self._lane_queues.get(lane_key)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._lane_queues[lane_key] = queue
+        queue.put_nowait(msg_id)
+
+        lane_task = self._forward_lanes.get(lane_key)
+        if lane_task is None or lane_task.done():
+            self._forward_lanes[lane_key] = asyncio.create_task(
+                self._forward_lane(lane_key, queue)
+            )
 
-            async with self.forward_lock:
-                while True:
-                    waiting_messages = await self.local_cache.get_waiting_messages()
-                    if not waiting_messages:
-                        if await self.local_cache.has_pending_messages():
-                            earliest = await self.local_cache.get_earliest_timestamp()
-                            if earliest:
-                                wait_time = self.banshi_waiting_time - (
-                                    time.time() - earliest
-                                )
-                                if wait_time > 0:
-                                    await asyncio.sleep(wait_time + 0.1)
-                                continue
+    async def _forward_lane(self, lane_key: str, queue: asyncio.Queue):
+        """单个来源群的转发通道，保证群内按顺序处理并独立冷却。
+
+        处理失败的消息在通道内原地退避重试，后面的消息等它处理完再继续，
+        以免打乱群内顺序；多次失败后才放回调度堆，避免一条坏消息卡死整个通道。
+        """
+        max_attempts = 5
+        while True:
+            msg_id = await queue.get()
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    await self._execute_forward_and_cool(
+                        lane_key, msg_id, queue.qsize()
+                    )
+                    self._delivered_entries.pop(str(msg_id))
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    if attempt >= max_attempts:
+                        logger.error(
+                            f"[QQ2TG] 群 {lane_key or '未知群号'} 处理消息连续失败 {attempt} 次，放回队列稍后重试: msg={msg_id}, error={exc}"
+                        )
+                        self.local_cache.requeue_message(msg_id, delay=60)
                         break
+                    delay = min(60, 5 * 2 ** (attempt - 1))
+                    logger.error(
+                        f"[QQ2TG] 群 {lane_key or '未知群号'} 处理消息异常，{delay}s 后重试: msg={msg_id}, attempt={attempt}, error={exc}"
+                    )
+                    await asyncio.sleep(delay)
+
+    async def _execute_forward_and_cool(self, lane_key: str, msg_id, queue_size: int):
+        client = self._resolve_qq_client()
+        async with self._lane_semaphore:
+            await self._forward_message(client, msg_id, queue_size)
+
+        # 冷却只阻塞本群通道，不占用并发名额
+        interval = self._get_banshi_interval_dynamic()
+        if interval > 0:
+            await asyncio.sleep(interval)
+
+    async def _forward_message(self, client, msg_id, queue_size: int = 0):
+        """处理单条成熟消息：获取内容、展开合并转发、转发并归档，最后移出缓存。"""
+        logger.info(f"[QQ2TG] 开始处理消息: id={msg_id}, queue={queue_size}")
+        earliest_timestamp_limit = time.time() - self.banshi_cache_seconds
+        msg_detail = await self.local_cache.get_message_payload(msg_id)
+        if not self._is_complete_payload(msg_detail):
+            try:
+                msg_detail = await client.api.call_action("get_msg", message_id=msg_id)
+            except Exception as exc:
+                logger.warning(f"[QQ2TG] get_msg 失败, id={msg_id}, error={exc}")
+                await self.local_cache.remove_cache(msg_id)
+                return
 
-                    for msg_id in waiting_messages:
-                        logger.info(
-                            f"[QQ2TG] 开始处理消息: id={msg_id}, queue={len(waiting_messages)}"
-                        )
-                        earliest_timestamp_limit = (
-                            time.time() - self.banshi_cache_seconds
-                        )
-                        try:
-                            msg_detail = await client.api.call_action(
-                                "get_msg", message_id=msg_id
-                            )
-                        except Exception as exc:
-                            logger.warning(
-                                f"[QQ2TG] get_msg 失败, id={msg_id}, error={exc}"
-                            )
-                            await self.local_cache.remove_cache(msg_id)
-                            continue
-
-                        msg_time = msg_detail.get("time", 0)
-                        msg_content = msg_detail.get("message", [])
-                        if msg_time < earliest_timestamp_limit or not msg_content:
-                            await self.local_cache.remove_cache(msg_id)
-                            continue
-
-                        if (
-                            not self.enable_telegram_forward
-                            and not self.enable_markdown_archive
-                        ):
-                            logger.warning("[QQ2TG] 所有输出通道均已关闭，跳过消息。")
-                            await self.local_cache.remove_cache(msg_id)
-                            continue
-
-                        if (
-                            self.enable_telegram_forward
-                            and not self.telegram_target_unified_origins
-                        ):
-                            logger.warning(
-                                "[QQ2TG] telegram_target_unified_origins 为空，Telegram 通道跳过。"
-                            )
-
-                        sender_info = msg_detail.get("sender", {})
-                        sender_name = (
-                            sender_info.get("card")
-                            or sender_info.get("nickname")
-                            or "未知用户"
-                        )
-                        sender_id = sender_info.get("user_id", "未知ID")
-                        cached_group_id = await self.local_cache.get_message_group_id(
-                            msg_id
-                        )
-                        ignore_forward = (
-                            await self.local_cache.get_message_ignore_forward(msg_id)
-                        )
-                        origin_group_id = (
-                            msg_detail.get("group_id")
-                            or cached_group_id
-                            or sender_info.get("group_id")
-                        )
-                        origin_group_key = self._group_state_key(origin_group_id)
-                        origin_group_id_text = (
-                            str(origin_group_id) if origin_group_id else "未知群号"
-                        )
-                        source_group_name = "未知群"
-
-                        if origin_group_id:
-                            try:
-                                group_info = await client.api.call_action(
-                                    "get_group_info",
-                                    group_id=int(origin_group_id),
-                                    no_cache=False,
-                                )
-                                source_group_name = group_info.get(
-                                    "group_name", source_group_name
-                                )
-                            except Exception:
-                                pass
-
-                        msg_time_str = self._format_msg_time(msg_time)
-                        day_str = self._archive_day_str(msg_time, msg_time_str)
-                        entry_list = await self._expand_segments_to_entries(
+        msg_time = msg_detail.get("time", 0)
+        msg_content = msg_detail.get("message", [])
+        if msg_time < earliest_timestamp_limit or not msg_content:
+            await self.local_cache.remove_cache(msg_id)
+            return
+
+        if not self.enable_telegram_forward and not self.enable_markdown_archive:
+            logger.warning("[QQ2TG] 所有输出通道均已关闭，跳过消息。")
+            await self.local_cache.remove_cache(msg_id)
+            return
+
+        if self.enable_telegram_forward and not self.telegram_target_unified_origins:
+            logger.warning(
+                "[QQ2TG] telegram_target_unified_origins 为空，Telegram 通道跳过。"
+            )
+
+        sender_info = msg_detail.get("sender", {})
+        sender_name = (
+            sender_info.get("card") or sender_info.get("nickname") or "未知用户"
+        )
+        sender_id = sender_info.get("user_id", "未知ID")
+        cached_group_id = await self.local_cache.get_message_group_id(msg_id)
+        ignore_forward = await self.local_cache.get_message_ignore_forward(msg_id)
+        origin_group_id = (
+            msg_detail.get("group_id") or cached_group_id or sender_info.get("group_id")
+        )
+        origin_group_key = self._group_state_key(origin_group_id)
+        origin_group_id_text = str(origin_group_id) if origin_group_id else "未知群号"
+        source_group_name = "未知群"
+
+        if origin_group_id:
+            source_group_name = (
+                await self.group_info_cache.get_group_name(client, origin_group_id)
+                or source_group_name
+            )
+
+        msg_time_str = self._format_msg_time(msg_time)
+        day_str = self._archive_day_str(msg_time, msg_time_str)
+        message_segments = parse_segments(msg_content)
+        archive_key = f"{origin_group_id_text}:{msg_id}"
+        archive_skip = False
+        archive_ok = bool(self.enable_markdown_archive)
+        archive_blocks = []
+        archive_target_file = ""
+        if self.enable_markdown_archive and self.markdown_archive:
+            archive_skip = await self.markdown_archive.has_processed(archive_key)
+            if archive_skip:
+                logger.info(f"[QQ2TG][Archive] 去重跳过: {archive_key}")
+
+        if ignore_forward:
+            logger.info(
+                f"[QQ2TG] 群 {origin_group_id_text} 当前消息仅归档，跳过 Telegram: {msg_id}"
+            )
+
+        if ignore_forward and origin_group_key:
+            plain_text = self._extract_plain_text(message_segments)
+            if plain_text and not self._text_starts_with_any_prefix(plain_text):
+                self._group_prefix_blocked.discard(origin_group_key)
+                ignore_forward = False
+                logger.info(
+                    f"[QQ2TG] 群 {origin_group_id_text} 命中解锁条件(非前缀纯文本)，本条起恢复 Telegram 转发。"
+                )
+
+        # 1. 收集所有的目标频道 ID
+        all_targets = []
+        # 2. 如果 TG 开关打开了，把 TG 的频道 ID 塞进去
+        if self.enable_telegram_forward:
+            all_targets.extend(self.telegram_target_unified_origins)
+        # 3. 如果 DC 开关打开了，把 DC 的频道 ID 塞进去
+        if getattr(self, "enable_discord_forward", False):
+            all_targets.extend(self.discord_target_unified_origins)
+
+        # 规则按代价从低到高执行；未通过的消息不下载附件、不转发，仍照常归档
+        evaluator = self._evaluator_for_group(origin_group_key)
+        rejected_by = ""
+        if evaluator is not None and all_targets and not ignore_forward:
+            rejected_by = await evaluator.rejecting_rule(
+                EvaluationContext(
+                    client=client,
+                    message_id=msg_id,
+                    group_id=origin_group_id_text,
+                    segments=message_segments,
+                    text=text_content(message_segments),
+                )
+            )
+            if rejected_by:
+                ignore_forward = True
+                logger.info(
+                    f"[QQ2TG] 群 {origin_group_id_text} 消息未通过评估规则，仅归档不转发: {msg_id}"
+                )
+
+        need_archive = bool(
+            self.enable_markdown_archive and self.markdown_archive and not archive_skip
+        )
+        if (ignore_forward or not all_targets) and not need_archive:
+            logger.info(f"[QQ2TG] 消息无需转发或归档，跳过展开: {msg_id}")
+            await self.local_cache.remove_cache(msg_id)
+            self.reaction_counter.discard(msg_id)
+            return
+
+        entry_count = 0
+        delivered = self._delivered_entries.get(str(msg_id))
+        if delivered is None:
+            delivered = set()
+            self._delivered_entries.set(str(msg_id), delivered)
+        archive_done = ("archive", 0) in delivered
+        # 附件按 URL 只下载一次，转发与归档共用，本条消息全部处理完后统一清理
+        attachments = self._new_attachment_broker()
+        try:
+            async for entry in self._iter_expanded_entries(
+                client=client,
+                segments=message_segments,
+                sender_name=sender_name,
+                sender_id=sender_id,
+                msg_time_str=msg_time_str,
+            ):
+                entry_count += 1
+                # 通道重试本消息时，已发送或已进入重试队列的目标、已写入的归档不再重复处理
+                pending_targets = [
+                    target_umo
+                    for target_umo in all_targets
+                    if (entry_count, target_umo) not in delivered
+                ]
+                await self._prefetch_attachments(
+                    client,
+                    origin_group_id,
+                    entry["segments"],
+                    attachments,
+                    upload=bool(pending_targets and not ignore_forward),
+                    archive=not archive_skip and not archive_done,
+                )
+
+                # --- 开始发送逻辑 ---
+                # 2. 如果目标池不为空，且这条消息允许被转发
+                if pending_targets and not ignore_forward:
+                    chains = await self._build_forward_chain(
+                        segments=entry["segments"],
+                        source_group_name=source_group_name,
+                        source_group_id=origin_group_id_text,
+                        source_group_id_raw=origin_group_id,
+                        sender_name=entry["sender_name"],
+                        sender_id=entry["sender_id"],
+                        msg_time_str=entry["msg_time_str"],
+                        client=client,
+                        attachments=attachments,
+                    )
+
+                    # 3. 各目标按自己的令牌桶限速，并发发送
+                    results = await asyncio.gather(
+                        *(
+                            self._send_to_target(msg_id, target_umo, chains)
+                            for target_umo in pending_targets
+                        ),
+                        return_exceptions=True,
+                    )
+                    for target_umo, result in zip(pending_targets, results):
+                        if not isinstance(result, BaseException):
+                            delivered.add((entry_count, target_umo))
+                    for result in results:
+                        if isinstance(result, BaseException):
+                            raise result
+
+                if need_archive and not archive_done:
+                    try:
+                        block = await self._build_markdown_block(
+                            segments=entry["segments"],
+                            source_group_name=source_group_name,
+                            source_group_id=origin_group_id_text,
+                            source_group_id_raw=origin_group_id,
+                            sender_name=entry["sender_name"],
+                            sender_id=entry["sender_id"],
+                            msg_time_str=entry["msg_time_str"],
+                            day_str=day_str,
+                            message_id=msg_id,
+                            ignored=ignore_forward,
+                            rejected_by=rejected_by,
                             client=client,
-                            msg_segments=msg_content,
-                            sender_name=sender_name,
-                            sender_id=sender_id,
-                            msg_time_str=msg_time_str,
+                            attachments=attachments,
                         )
-                        logger.info(
-                            f"[QQ2TG] 消息展开完成: msg={msg_id}, entries={len(entry_list)}, group={origin_group_id_text}"
+                        archive_blocks.append(block)
+                    except Exception as exc:
+                        archive_ok = False
+                        logger.error(
+                            f"[QQ2TG][Archive] 写入失败: msg={msg_id}, error={exc}"
                         )
+        finally:
+            await attachments.cleanup()
 
-                        archive_key = f"{origin_group_id_text}:{msg_id}"
-                        archive_skip = False
-                        archive_ok = bool(self.enable_markdown_archive)
-                        archive_written_count = 0
-                        archive_target_file = ""
-                        if self.enable_markdown_archive and self.markdown_archive:
-                            archive_skip = await self.markdown_archive.has_processed(
-                                archive_key
-                            )
-                            if archive_skip:
-                                logger.info(f"[QQ2TG][Archive] 去重跳过: {archive_key}")
-
-                        if ignore_forward:
-                            logger.info(
-                                f"[QQ2TG] 群 {origin_group_id_text} 当前消息仅归档，跳过 Telegram: {msg_id}"
-                            )
-
-                        if ignore_forward and origin_group_key:
-                            plain_text = self._extract_plain_text_from_segments(
-                                msg_content
-                            )
-                            if plain_text and not self._text_starts_with_any_prefix(
-                                plain_text
-                            ):
-                                self._group_prefix_blocked.discard(origin_group_key)
-                                ignore_forward = False
-                                logger.info(
-                                    f"[QQ2TG] 群 {origin_group_id_text} 命中解锁条件(非前缀纯文本)，本条起恢复 Telegram 转发。"
-                                )
-
-                        for entry in entry_list:
-                            # 1. 收集所有的目标频道 ID
-                            all_targets = []
-                            # 2. 如果 TG 开关打开了，把 TG 的频道 ID 塞进去
-                            if self.enable_telegram_forward:
-                                all_targets.extend(self.telegram_target_unified_origins)
-                            # 3. 如果 DC 开关打开了，把 DC 的频道 ID 塞进去
-                            if getattr(self, "enable_discord_forward", False):
-                                all_targets.extend(self.discord_target_unified_origins)
-
-                            # --- 开始发送逻辑 ---
-                            # 2. 如果目标池不为空，且这条消息允许被转发
-                            if all_targets and not ignore_forward:
-                                chains, temp_files = await self._build_forward_chain(
-                                    msg_content=entry["msg_content"],
-                                    source_group_name=source_group_name,
-                                    source_group_id=origin_group_id_text,
-                                    source_group_id_raw=origin_group_id,
-                                    sender_name=entry["sender_name"],
-                                    sender_id=entry["sender_id"],
-                                    msg_time_str=entry["msg_time_str"],
-                                    client=client,
-                                )
-
-                                # 3. 遍历目标池统一发送
-                                for target_umo in all_targets:
-                                    try:
-                                        message_chain = MessageChain()
-                                        message_chain.chain = list(chains)
-                                        await self.context.send_message(
-                                            target_umo, message_chain
-                                        )
-                                        logger.info(
-                                            f"[QQ2Multi] 转发成功: msg={msg_id} -> {target_umo}"
-                                        )
-                                    except Exception as exc:
-                                        logger.error(
-                                            f"[QQ2Multi] 转发失败: msg={msg_id} -> {target_umo}, error={exc}"
-                                        )
-                                    await asyncio.sleep(0.2)
-
-                                # 4. 发送完毕后，清理下载的图片/文件垃圾
-                                for temp_path in temp_files:
-                                    try:
-                                        if temp_path and os.path.exists(temp_path):
-                                            os.remove(temp_path)
-                                    except Exception:
-                                        pass
-
-                            if (
-                                self.enable_markdown_archive
-                                and self.markdown_archive
-                                and not archive_skip
-                            ):
-                                try:
-                                    block = await self._build_markdown_block(
-                                        msg_content=entry["msg_content"],
-                                        source_group_name=source_group_name,
-                                        source_group_id=origin_group_id_text,
-                                        source_group_id_raw=origin_group_id,
-                                        sender_name=entry["sender_name"],
-                                        sender_id=entry["sender_id"],
-                                        msg_time_str=entry["msg_time_str"],
-                                        day_str=day_str,
-                                        message_id=msg_id,
-                                        ignored=ignore_forward,
-                                        client=client,
-                                    )
-                                    archive_target_file = (
-                                        await self.markdown_archive.append_entry(
-                                            day_str, block
-                                        )
-                                    )
-                                    archive_written_count += 1
-                                except Exception as exc:
-                                    archive_ok = False
-                                    logger.error(
-                                        f"[QQ2TG][Archive] 写入失败: msg={msg_id}, error={exc}"
-                                    )
-
-                        if (
-                            self.enable_markdown_archive
-                            and self.markdown_archive
-                            and not archive_skip
-                            and archive_ok
-                        ):
-                            await self.markdown_archive.mark_processed(
-                                archive_key,
-                                {
-                                    "ts": int(time.time()),
-                                    "msg_time": msg_time_str,
-                                    "day": day_str,
-                                },
-                            )
-                            logger.info(
-                                f"[QQ2TG][Archive] 归档成功: msg={msg_id}, entries={archive_written_count}, file={archive_target_file}"
-                            )
+        logger.info(
+            f"[QQ2TG] 消息展开完成: msg={msg_id}, entries={entry_count}, group={origin_group_id_text}"
+        )
 
-                        logger.info(
-                            f"[QQ2TG] 消息处理完成: msg={msg_id}, telegram={self.enable_telegram_forward}, markdown={self.enable_markdown_archive}"
-                        )
+        if need_archive and archive_ok and archive_blocks:
+            try:
+                # 一条消息展开出的所有块作为整体追加，并发的其他群通道不会插在中间；
+                # 去重索引立即落盘, 归档内容也要先写出, 避免崩溃后消息被标记为已归档却不在文件中
+                archive_target_file, archive_seq = (
+                    await self.markdown_archive.append_entry(
+                        day_str, "".join(archive_blocks), origin_group_id_text
+                    )
+                )
+                await self.markdown_archive.flush_entry(archive_target_file, archive_seq)
+                delivered.add(("archive", 0))
+            except Exception as exc:
+                archive_ok = False
+                logger.error(
+                    f"[QQ2TG][Archive] 写入失败: msg={msg_id}, error={exc}"
+                )
 
-                        await self.local_cache.remove_cache(msg_id)
-                        interval = self._get_banshi_interval_dynamic()
-                        await asyncio.sleep(interval)
-        except asyncio.CancelledError:
-            logger.warning(f"[QQ2TG][ID:{self.instance_id}] 转发任务被取消")
-            raise
+        if (
+            self.enable_markdown_archive
+            and self.markdown_archive
+            and not archive_skip
+            and archive_ok
+        ):
+            await self.markdown_archive.mark_processed(
+                archive_key,
+                {
+                    "ts": int(time.time()),
+                    "msg_time": msg_time_str,
+                    "day": day_str,
+                },
+            )
+            logger.info(
+                f"[QQ2TG][Archive] 归档成功: msg={msg_id}, entries={len(archive_blocks)}, file={archive_target_file}"
+            )
+
+        logger.info(
+            f"[QQ2TG] 消息处理完成: msg={msg_id}, telegram={self.enable_telegram_forward}, markdown={self.enable_markdown_archive}"
+        )
+
+        await self.local_cache.remove_cache(msg_id)
+        self.reaction_counter.discard(msg_id)
+
+    def _target_platform(self, target_umo: str) -> str:
+        if target_umo in self.discord_target_unified_origins:
+            return "discord"
+        if target_umo in self.telegram_target_unified_origins:
+            return "telegram"
+        return str(target_umo).split(":", 1)[0]
+
+    @staticmethod
+    def _serialize_chain(chains: list) -> list:
+        """把消息链转换为可持久化的字典列表，供重试队列使用。"""
+        data = []
+        for comp in chains:
+            if isinstance(comp, Comp.Plain):
+                data.append({"type": "plain", "text": comp.text})
+            elif isinstance(comp, Comp.Image):
+                image_file = getattr(comp, "file", None) or getattr(comp, "url", "")
+                if isinstance(image_file, str) and image_file.startswith("file:///"):
+                    data.append(
+                        {"type": "image", "path": image_file[len("file:///") :]}
+                    )
+                else:
+                    data.append({"type": "image", "url": image_file})
+            elif isinstance(comp, Comp.File):
+                data.append(
+                    {
+                        "type": "file",
+                        "path": getattr(comp, "file", ""),
+                        "name": getattr(comp, "name", ""),
+                    }
+                )
+        return data
+
+    @staticmethod
+    def _deserialize_chain(data: list) -> list:
+        chains = []
+        for item in data:
+            item_type = item.get("type")
+            if item_type == "plain":
+                chains.append(Comp.Plain(item.get("text", "")))
+            elif item_type == "image" and item.get("path"):
+                chains.append(Comp.Image.fromFileSystem(item["path"]))
+            elif item_type == "image" and item.get("url"):
+                chains.append(Comp.Image.fromURL(item["url"]))
+            elif item_type == "file":
+                chains.append(Comp.File(file=item.get("path"), name=item.get("name")))
+        return chains
+
+    async def _send_chain(self, target_umo: str, chains: list):
+        message_chain = MessageChain()
+        message_chain.chain = list(chains)
+        sent = await self.context.send_message(target_umo, message_chain)
+        if sent is False:
+            raise RuntimeError("未找到目标会话对应的平台")
+
+    async def _attempt_send(self, target_umo: str, chains: list):
+        """限速后实际发送一次，并把结果记入熔断器；失败时抛出异常。
+
+        调用方已通过 allow_request 占用半开状态的探测名额时，无论以何种方式结束
+        都会记入成功/失败或释放名额，避免目标永远停在等待探测的状态。
+        """
+        platform = self._target_platform(target_umo)
+        resolved = False
+        try:
+            await self.target_rate_limiter.acquire(target_umo, platform)
+            try:
+                await self._send_chain(target_umo, chains)
+            except Exception as exc:
+                retry_after = extract_retry_after(exc)
+                if retry_after:
+                    # 平台限流说明目标本身可用，只暂停令牌桶，不计入熔断
+                    self.target_rate_limiter.pause(target_umo, retry_after, platform)
+                else:
+                    self.target_breakers.record_failure(target_umo, exc)
+                    resolved = True
+                raise
+            self.target_breakers.record_success(target_umo)
+            resolved = True
         finally:
-            self._forward_task = None
+            if not resolved:
+                self.target_breakers.release_probe(target_umo)
+
+    async def _send_to_target(self, msg_id, target_umo: str, chains: list) -> bool:
+        # 目标熔断、限流中或已有待重试消息时直接排到重试队列之后，既不阻塞其他目标，
+        # 也保证该目标内的消息顺序
+        paused = self.target_rate_limiter.paused_for(target_umo)
+        if (
+            paused > 0
+            or self.delivery_retry_queue.pending_count(target_umo)
+            or not self.target_breakers.allow_request(target_umo)
+        ):
+            await self.delivery_retry_queue.enqueue(
+                msg_id,
+                target_umo,
+                self._serialize_chain(chains),
+                error="目标熔断、限流中或存在待重试消息",
+                retry_after=max(paused, self.target_breakers.retry_in(target_umo)),
+                attempted=False,
+            )
+            return False
+
+        try:
+            await self._attempt_send(target_umo, chains)
+            logger.info(f"[QQ2Multi] 转发成功: msg={msg_id} -> {target_umo}")
+            return True
+        except Exception as exc:
+            logger.error(
+                f"[QQ2Multi] 转发失败: msg={msg_id} -> {target_umo}, error={exc}"
+            )
+            await self.delivery_retry_queue.enqueue(
+                msg_id,
+                target_umo,
+                self._serialize_chain(chains),
+                error=exc,
+                retry_after=extract_retry_after(exc),
+            )
+            return False
+
+    async def _deliver_chain_data(self, target_umo: str, chain_data: list):
+        """重试队列的发送回调，失败时抛出异常交由队列退避。"""
+        if not self.target_breakers.allow_request(target_umo):
+            # 熔断中或探测名额已被占用，条目未实际发送，不计入重试次数
+            raise DeliveryHeld(
+                "目标处于熔断状态，等待探测",
+                retry_after=self.target_breakers.retry_in(target_umo) or None,
+            )
+        await self._attempt_send(target_umo, self._deserialize_chain(chain_data))
 
     async def terminate(self):
         try:
             if self._forward_task and not self._forward_task.done():
                 self._forward_task.cancel()
+                await asyncio.gather(self._forward_task, return_exceptions=True)
+            self._forward_task = None
+            if self._group_warm_task and not self._group_warm_task.done():
+                self._group_warm_task.cancel()
+            for task in list(self._forward_prefetch_tasks):
+                task.cancel()
+            await self.delivery_retry_queue.stop()
+            await self.downloader.close()
+            self.local_cache.close()
+            if self.markdown_archive:
+                await self.markdown_archive.close()
         except Exception as exc:
             logger.error(f"[QQ2TG][ID:{self.instance_id}] terminate 失败: {exc}")
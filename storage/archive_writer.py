@@ -0,0 +1,190 @@
+# archive_writer.py
+
+import os
+import asyncio
+from astrbot.api import logger
+
+
+class ArchiveWriter:
+    """Markdown 归档的缓冲写入器。
+
+    写入先进入内存缓冲，单个文件累计到 ``flush_bytes`` 或每隔 ``flush_interval``
+    秒由后台线程批量追加到文件；文件句柄按天保持打开，出现新的一天时关闭旧的。
+    每个文件有独立的锁，不同文件 (如按群分区后的各群) 的落盘互不阻塞。
+    durability 控制落盘保证：``none`` 只写入系统缓存，``interval`` 每次定时
+    刷新后 fsync，``always`` 每次写入都立即刷新并 fsync 后才返回。
+
+    每次 ``write`` 的内容作为一个整体追加，返回该文件内递增的序号；
+    写入失败时内容放回缓冲并截掉已写出的部分，``flush_path`` 据序号确认自己的内容已落盘。
+    """
+
+    DURABILITY_MODES = ("none", "interval", "always")
+
+    def __init__(
+        self,
+        flush_interval: float = 2.0,
+        flush_bytes: int = 64 * 1024,
+        durability: str = "interval",
+    ):
+        self.flush_interval = max(0.1, float(flush_interval))
+        self.flush_bytes = max(1, int(flush_bytes))
+        self.durability = (
+            durability if durability in self.DURABILITY_MODES else "interval"
+        )
+
+        self._buffers: dict[str, list[tuple[int, str]]] = {}
+        self._buffered_bytes: dict[str, int] = {}
+        self._handles: dict[str, object] = {}
+        self._path_days: dict[str, str] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._last_seq: dict[str, int] = {}
+        self._written_seq: dict[str, int] = {}
+        self._current_day = ""
+        self._task = None
+
+    async def write(self, day_str: str, path: str, content: str) -> int:
+        """把 content 加入 path 的缓冲，返回它在该文件内的序号"""
+        seq = self._last_seq.get(path, 0) + 1
+        self._last_seq[path] = seq
+        self._buffers.setdefault(path, []).append((seq, content))
+        self._buffered_bytes[path] = self._buffered_bytes.get(path, 0) + len(
+            content.encode("utf-8")
+        )
+        self._current_day = max(self._current_day, day_str)
+        self._path_days[path] = day_str
+
+        if self.durability == "always":
+            await self._flush_path(path, fsync=True)
+            return seq
+        if self._buffered_bytes[path] >= self.flush_bytes:
+            await self._flush_path(path)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+        return seq
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush(fsync=self.durability != "none")
+        except Exception as exc:
+            logger.error(f"[ArchiveWriter] 定时写入失败: {exc}")
+
+    async def flush(self, fsync: bool = False):
+        """并发刷新所有文件；跨天后顺带关闭旧日期的文件句柄"""
+        paths = set(self._buffers)
+        if fsync:
+            paths.update(self._handles)
+        stale = {
+            path
+            for path in self._handles
+            if self._path_days.get(path, "") < self._current_day
+        }
+        paths.update(stale)
+        if not paths:
+            return
+        await asyncio.gather(
+            *(
+                self._flush_path(path, fsync=fsync, close=path in stale)
+                for path in paths
+            )
+        )
+
+    async def flush_path(self, path: str, seq: int):
+        """确认序号为 seq 的内容已写入系统缓存 (always 模式下同时 fsync)。
+
+        登记去重索引前调用，保证索引里记为已归档的消息在进程崩溃后不会丢失；
+        本次或之前的写入失败时抛出异常。
+        """
+        if self._written_seq.get(path, 0) >= seq:
+            return
+        await self._flush_path(path, fsync=self.durability == "always")
+        if self._written_seq.get(path, 0) < seq:
+            raise OSError(f"归档内容未写入: {path}")
+
+    async def _flush_path(self, path: str, fsync: bool = False, close: bool = False):
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            parts = self._buffers.pop(path, None)
+            self._buffered_bytes.pop(path, None)
+            fp = self._handles.get(path)
+            if not parts and not (fp is not None and (fsync or close)):
+                return
+            # 文件句柄的登记与移除只在事件循环线程中进行，工作线程只操作传入的句柄
+            future = asyncio.ensure_future(
+                asyncio.to_thread(self._write_path, path, fp, parts, fsync, close)
+            )
+            try:
+                try:
+                    fp = await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # 线程中的写入无法中断，等它完成后再释放锁，避免并发操作同一文件句柄
+                    self._written(path, await future, parts)
+                    raise
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # 失败的文件句柄已在线程中关闭，内容放回缓冲前端等待下次写入
+                self._handles.pop(path, None)
+                if parts:
+                    self._restore(path, parts)
+                raise
+            self._written(path, fp, parts)
+
+    def _written(self, path: str, fp, parts):
+        if fp is None:
+            self._handles.pop(path, None)
+        else:
+            self._handles[path] = fp
+        if parts:
+            self._written_seq[path] = parts[-1][0]
+
+    def _restore(self, path: str, parts):
+        self._buffers[path] = parts + self._buffers.get(path, [])
+        self._buffered_bytes[path] = sum(
+            len(content.encode("utf-8")) for _, content in self._buffers[path]
+        )
+
+    @staticmethod
+    def _write_path(path: str, fp, parts, fsync: bool, close: bool):
+        """在工作线程中写入并返回仍保持打开的句柄，已关闭时返回 None"""
+        if parts:
+            if fp is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fp = open(path, "a", encoding="utf-8")
+            start = os.fstat(fp.fileno()).st_size
+            try:
+                fp.write("".join(content for _, content in parts))
+                fp.flush()
+            except Exception:
+                # 截掉写了一半的内容，重试时整块重新追加
+                try:
+                    fp.close()
+                except Exception:
+                    pass
+                try:
+                    os.truncate(path, start)
+                except OSError:
+                    pass
+                raise
+        if fp is None:
+            return None
+        if fsync:
+            try:
+                os.fsync(fp.fileno())
+            except OSError as exc:
+                # 内容已交给系统，fsync 失败不重复写入
+                logger.error(f"[ArchiveWriter] fsync 失败: {path}, error={exc}")
+        # 迟到的旧日期消息写入时会重新打开
+        if close:
+            fp.close()
+            return None
+        return fp
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush(fsync=self.durability != "none")
+        for path in list(self._handles):
+            await self._flush_path(path, close=True)
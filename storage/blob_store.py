@@ -0,0 +1,130 @@
+# blob_store.py
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import asyncio
+from astrbot.api import logger
+
+
+class BlobStore:
+    """按内容寻址的附件存储。
+
+    文件按 sha256 存放在 ``blobs/ab/cd/<sha256><ext>``，相同内容只保存一份；
+    URL / QQ 文件 id 等指纹记录在 ``asset_fingerprints.jsonl``，
+    已知附件无需下载即可直接复用。
+    """
+
+    def __init__(self, blob_dir: str, index_file: str):
+        self.blob_dir = os.path.abspath(blob_dir)
+        self.index_file = index_file
+        self._fingerprints: dict[str, str] = {}
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(record, dict) and record.get("fp"):
+                        self._fingerprints[record["fp"]] = record.get("blob", "")
+        except FileNotFoundError:
+            pass
+
+    def _append_index(self, fingerprints, blob_rel: str):
+        new = [
+            fp for fp in fingerprints if fp and self._fingerprints.get(fp) != blob_rel
+        ]
+        if not new:
+            return
+        with open(self.index_file, "a", encoding="utf-8") as f:
+            for fp in new:
+                self._fingerprints[fp] = blob_rel
+                f.write(
+                    json.dumps({"fp": fp, "blob": blob_rel}, ensure_ascii=False) + "\n"
+                )
+
+    @staticmethod
+    def _ext_of(name: str) -> str:
+        ext = os.path.splitext(name or "")[1].lower()
+        return ext if 1 < len(ext) <= 10 and ext[1:].isalnum() else ""
+
+    def blob_path(self, blob_rel: str) -> str:
+        return os.path.join(self.blob_dir, blob_rel)
+
+    def lookup(self, fingerprints) -> str | None:
+        """按指纹查找已保存的 blob，返回绝对路径"""
+        for fp in fingerprints:
+            blob_rel = self._fingerprints.get(fp)
+            if not blob_rel:
+                continue
+            path = self.blob_path(blob_rel)
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _put(self, src_path: str, name: str, fingerprints) -> str:
+        sha = self._hash_file(src_path)
+        blob_rel = os.path.join(sha[:2], sha[2:4], sha + self._ext_of(name))
+        target = self.blob_path(blob_rel)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                os.link(src_path, tmp)
+            except OSError:
+                shutil.copyfile(src_path, tmp)
+            os.replace(tmp, target)
+        self._append_index(fingerprints, blob_rel)
+        return target
+
+    async def put(self, src_path: str, name: str, fingerprints=()) -> str:
+        """保存文件内容 (源文件不变)，登记指纹，返回 blob 绝对路径"""
+        return await asyncio.to_thread(self._put, src_path, name, tuple(fingerprints))
+
+    async def remember(self, blob_path: str, fingerprints):
+        """为已存在的 blob 补登记新的指纹"""
+        blob_rel = os.path.relpath(blob_path, self.blob_dir)
+        await asyncio.to_thread(self._append_index, tuple(fingerprints), blob_rel)
+
+    @staticmethod
+    def _link(blob_path: str, target_path: str):
+        if os.path.lexists(target_path):
+            return
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(blob_path, target_path)
+            return
+        except OSError:
+            pass
+        try:
+            os.symlink(
+                os.path.relpath(blob_path, os.path.dirname(target_path)), target_path
+            )
+            return
+        except OSError:
+            pass
+        shutil.copyfile(blob_path, target_path)
+
+    async def link(self, blob_path: str, target_path: str):
+        """在日期目录中放置指向 blob 的硬链接，不支持时依次退回相对软链接、复制"""
+        try:
+            await asyncio.to_thread(self._link, blob_path, target_path)
+        except OSError as exc:
+            logger.warning(f"[BlobStore] 链接附件失败: {target_path}, error={exc}")
+            raise
@@ -0,0 +1,124 @@
+# group_info_cache.py
+
+from ..config import TEMP_DIR
+from ..utils.cache_utils import TTLCache
+import os
+import json
+import asyncio
+from astrbot.api import logger
+
+
+class GroupInfoCache:
+    """群信息 (群名) 的 TTL 缓存, 可选持久化到 ``group_info.json``。
+
+    并发查询同一个群时只发起一次 get_group_info。
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, persist: bool = True):
+        self.cache_file = os.path.join(TEMP_DIR, "group_info.json")
+        self.persist = persist
+        self._cache = TTLCache(maxsize=4096, ttl=max(1, int(ttl_seconds)))
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        if self.persist:
+            self._load()
+
+    @staticmethod
+    def _key(group_id) -> str:
+        try:
+            return str(int(group_id))
+        except (TypeError, ValueError):
+            return str(group_id or "").strip()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError:
+            logger.warning("[GroupInfoCache][LOAD] 群信息缓存格式错误，已忽略。")
+            return
+
+        for group_key, item in (data if isinstance(data, dict) else {}).items():
+            if not isinstance(item, dict):
+                continue
+            try:
+                expires_at = float(item.get("expires_at", 0))
+            except (TypeError, ValueError):
+                continue
+            self._cache.set(group_key, item, expires_at=expires_at)
+
+    def _save(self):
+        if not self.persist:
+            return
+        data = {
+            group_key: {**item, "expires_at": expires_at}
+            for group_key, item, expires_at in self._cache.items()
+        }
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as exc:
+            logger.warning(f"[GroupInfoCache] 保存群信息缓存失败: {exc}")
+
+    def get_cached_name(self, group_id) -> str | None:
+        item = self._cache.get(self._key(group_id))
+        return item.get("group_name") if item else None
+
+    def update_name(self, group_id, group_name: str):
+        group_key = self._key(group_id)
+        if not group_key or not group_name:
+            return
+        self._cache.set(group_key, {"group_name": str(group_name)})
+        self._save()
+
+    def invalidate(self, group_id):
+        if self._cache.pop(self._key(group_id)) is not None:
+            self._save()
+
+    async def get_group_name(self, client, group_id) -> str | None:
+        """返回群名，缓存未命中时调用 get_group_info，失败返回 None"""
+        group_key = self._key(group_id)
+        if not group_key:
+            return None
+
+        cached = self.get_cached_name(group_key)
+        if cached is not None:
+            return cached
+
+        inflight = self._inflight.get(group_key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[group_key] = future
+        group_name = None
+        try:
+            group_info = await client.api.call_action(
+                "get_group_info",
+                group_id=int(group_key),
+                no_cache=False,
+            )
+            if isinstance(group_info, dict) and group_info.get("group_name"):
+                group_name = str(group_info["group_name"])
+                self.update_name(group_key, group_name)
+        except Exception as exc:
+            logger.debug(
+                f"[GroupInfoCache] get_group_info 失败, group={group_key}, error={exc}"
+            )
+        finally:
+            self._inflight.pop(group_key, None)
+            future.set_result(group_name)
+        return group_name
+
+    async def warm(self, client, group_ids):
+        """启动时预热来源群的群名"""
+        names = await asyncio.gather(
+            *(self.get_group_name(client, group_id) for group_id in group_ids)
+        )
+        warmed = sum(1 for name in names if name)
+        if warmed:
+            logger.info(f"[GroupInfoCache] 已预热群信息 {warmed}/{len(names)} 个")
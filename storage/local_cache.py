@@ -4,24 +4,48 @@ from ..config import TEMP_DIR, WAITING_TIME
 import os
 import json
 import time
+import heapq
 import asyncio
 from astrbot.api import logger
 
 
 class LocalCache:
-    def __init__(self, max_age_seconds: int = 3600, waiting_time: int | None = None):
+    """待转发消息缓存。
+
+    内存字典是唯一数据源，磁盘上由快照 ``local_cache.json`` 与追加写日志
+    ``local_cache.journal`` 共同保证持久化：每次增删只追加一行日志，日志累计到
+    ``compact_threshold`` 条后合并回快照；启动时先读快照再重放日志。
+
+    成熟调度使用以成熟时间 (``ts + WAITING_TIME``，条目可用 ``wait`` 单独指定)
+    为键的最小堆，删除采用惰性失效；``add_cache`` 插入更早成熟的消息时会唤醒
+    ``wait_for_mature`` 的等待者。
+    """
+
+    def __init__(
+        self,
+        max_age_seconds: int = 3600,
+        waiting_time: int | None = None,
+        compact_threshold: int = 500,
+    ):
         self.cache_file = os.path.join(TEMP_DIR, "local_cache.json")
+        self.journal_file = os.path.join(TEMP_DIR, "local_cache.journal")
         self.WAITING_TIME = waiting_time if waiting_time is not None else WAITING_TIME
         self.MAX_CACHE_AGE_SECONDS = max_age_seconds
+        self.compact_threshold = max(1, int(compact_threshold))
 
         self._file_lock = asyncio.Lock()
+        self._entries: dict[str, dict] = {}
+        self._journal_fp = None
+        self._journal_records = 0
+
+        self._heap: list[tuple[float, str]] = []
+        self._due: dict[str, float] = {}
+        self._wakeup = asyncio.Event()
 
         cache_dir = os.path.dirname(self.cache_file)
         os.makedirs(cache_dir, exist_ok=True)
 
-        if not os.path.exists(self.cache_file):
-            with open(self.cache_file, "w") as f:
-                json.dump({}, f)
+        self._load()
 
     @staticmethod
     def _parse_cache_entry(entry):
@@ -38,162 +62,251 @@ class LocalCache:
             return ts, group_id, ignore_forward
         return 0.0, None, False
 
+    @classmethod
+    def _normalize_entry(cls, entry) -> dict:
+        timestamp, group_id, ignore_forward = cls._parse_cache_entry(entry)
+        normalized = {
+            "ts": timestamp,
+            "group_id": group_id,
+            "ignore_forward": ignore_forward,
+        }
+        payload = entry.get("payload") if isinstance(entry, dict) else None
+        if isinstance(payload, dict):
+            normalized["payload"] = payload
+        wait = entry.get("wait") if isinstance(entry, dict) else None
+        if isinstance(wait, (int, float)):
+            normalized["wait"] = float(wait)
+        return normalized
+
+    def _due_time(self, entry: dict) -> float:
+        return entry["ts"] + entry.get("wait", self.WAITING_TIME)
+
+    def _load(self):
+        """读取快照并重放日志，随后立即压缩，保证启动后日志为空。"""
+        try:
+            with open(self.cache_file, "r") as f:
+                snapshot = json.load(f)
+            if isinstance(snapshot, dict):
+                for message_id_str, entry in snapshot.items():
+                    self._entries[str(message_id_str)] = self._normalize_entry(entry)
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError:
+            logger.error("[LocalCache][LOAD] 快照内容格式错误，已忽略。")
+
+        replayed = 0
+        try:
+            with open(self.journal_file, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程异常退出时最后一行可能只写了一半
+                        logger.warning("[LocalCache][LOAD] 跳过损坏的日志记录。")
+                        continue
+                    self._apply_record(record)
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+
+        if replayed:
+            logger.info(f"[LocalCache][LOAD] 已重放日志 {replayed} 条")
+        self._compact()
+
+        for message_id_str, entry in self._entries.items():
+            self._schedule(message_id_str, self._due_time(entry))
+
+    def _apply_record(self, record: dict):
+        if not isinstance(record, dict):
+            return
+        message_id_str = str(record.get("id", ""))
+        if not message_id_str:
+            return
+        op = record.get("op")
+        if op == "add":
+            self._entries[message_id_str] = self._normalize_entry(record)
+        elif op == "del":
+            self._entries.pop(message_id_str, None)
+
+    def _append_journal(self, record: dict):
+        if self._journal_fp is None:
+            self._journal_fp = open(self.journal_file, "a")
+        self._journal_fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal_fp.flush()
+        self._journal_records += 1
+        if self._journal_records >= self.compact_threshold:
+            self._compact()
+
+    def _compact(self):
+        """把内存状态整体写入快照并清空日志。"""
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_file, self.cache_file)
+
+        if self._journal_fp is not None:
+            self._journal_fp.close()
+        self._journal_fp = open(self.journal_file, "w")
+        self._journal_records = 0
+
+    def _schedule(self, message_id_str: str, due: float):
+        self._due[message_id_str] = due
+        heapq.heappush(self._heap, (due, message_id_str))
+        if self._heap[0][1] == message_id_str:
+            self._wakeup.set()
+
+    def _prune_heap_head(self):
+        while self._heap:
+            due, message_id_str = self._heap[0]
+            if self._due.get(message_id_str) == due:
+                return
+            heapq.heappop(self._heap)
+
     async def _cleanup_expired_cache(self) -> int:
         """清理缓存中超过 MAX_CACHE_AGE_SECONDS 的消息，并返回清理数量。"""
         current_time = time.time()
-        cleaned_count = 0
 
         async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-
-            except (FileNotFoundError, json.JSONDecodeError):
-                logger.error("[LocalCache][CLEANUP] 错误：文件不存在或内容格式错误。")
-                return 0
-
-            keys_to_keep = {}
-            for message_id_str, entry in cache.items():
-                timestamp, group_id, ignore_forward = self._parse_cache_entry(entry)
-                if (
-                    timestamp <= 0
-                    or current_time - timestamp > self.MAX_CACHE_AGE_SECONDS
-                ):
-                    cleaned_count += 1
-                else:
-                    keys_to_keep[message_id_str] = {
-                        "ts": timestamp,
-                        "group_id": group_id,
-                        "ignore_forward": ignore_forward,
-                    }
-
-            if cleaned_count > 0:
-                with open(self.cache_file, "w") as f:
-                    json.dump(keys_to_keep, f)
-
-            return cleaned_count
+            expired = [
+                message_id_str
+                for message_id_str, entry in self._entries.items()
+                if entry["ts"] <= 0
+                or current_time - entry["ts"] > self.MAX_CACHE_AGE_SECONDS
+            ]
+            for message_id_str in expired:
+                del self._entries[message_id_str]
+                self._due.pop(message_id_str, None)
+
+            if expired:
+                self._compact()
+
+            return len(expired)
 
     async def add_cache(
-        self, message_id: int, group_id=None, ignore_forward: bool = False
+        self,
+        message_id: int,
+        group_id=None,
+        ignore_forward: bool = False,
+        payload: dict | None = None,
+        wait: float | None = None,
     ):
-        """添加一条message_id进入缓存, 保存时间"""
+        """添加一条message_id进入缓存, 保存时间
+
+        payload 为入站时截取的消息快照 (message/sender/time/group_id)，
+        转发时可据此跳过 get_msg 调用；wait 为该消息的等待秒数，缺省使用 WAITING_TIME。
+        """
         str_message_id = str(message_id)
 
         async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                cache = {}
-
-            cache[str_message_id] = {
+            entry = {
                 "ts": time.time(),
                 "group_id": group_id,
                 "ignore_forward": bool(ignore_forward),
             }
-
-            with open(self.cache_file, "w") as f:
-                json.dump(cache, f)
-
-    async def get_waiting_messages(self) -> list:
-        """获取已经等待足够时间的消息列表"""
-
-        waiting_messages = []
-        current_time = time.time()
-
-        async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-
-            except (FileNotFoundError, json.JSONDecodeError):
-                return []
-
-        for message_id_str, entry in cache.items():
-            timestamp, _, _ = self._parse_cache_entry(entry)
-            if current_time - timestamp > self.WAITING_TIME:
-                waiting_messages.append(message_id_str)
-
-        return waiting_messages
-
-    async def get_earliest_timestamp(self) -> float | None:
-        """获取缓存中最早的时间戳，用于计算等待时间。如果没有消息返回 None。"""
-        async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return None
-
-        if not cache:
-            return None
-
-        timestamps = []
-        for entry in cache.values():
-            ts, _, _ = self._parse_cache_entry(entry)
-            if ts > 0:
-                timestamps.append(ts)
-        return min(timestamps) if timestamps else None
+            if isinstance(payload, dict):
+                entry["payload"] = payload
+            if wait is not None:
+                entry["wait"] = float(wait)
+            self._entries[str_message_id] = entry
+            self._append_journal({"op": "add", "id": str_message_id, **entry})
+            self._schedule(str_message_id, self._due_time(entry))
 
     async def get_message_group_id(self, message_id: int | str):
-        str_message_id = str(message_id)
-
-        async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return None
-
-        if str_message_id not in cache:
-            return None
-
-        _, group_id, _ = self._parse_cache_entry(cache[str_message_id])
-        return group_id
+        entry = self._entries.get(str(message_id))
+        return entry["group_id"] if entry else None
 
     async def get_message_ignore_forward(self, message_id: int | str) -> bool:
-        str_message_id = str(message_id)
+        entry = self._entries.get(str(message_id))
+        return entry["ignore_forward"] if entry else False
 
-        async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return False
-
-        if str_message_id not in cache:
-            return False
+    async def get_message_payload(self, message_id: int | str) -> dict | None:
+        entry = self._entries.get(str(message_id))
+        return entry.get("payload") if entry else None
 
-        _, _, ignore_forward = self._parse_cache_entry(cache[str_message_id])
-        return ignore_forward
-
-    async def has_pending_messages(self) -> bool:
-        """检查缓存中是否还有消息（无论是否成熟）"""
-        async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-                return bool(cache)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return False
+    @property
+    def pending_count(self) -> int:
+        """缓存中的消息数量，纯内存读取，可在热路径上同步调用。"""
+        return len(self._entries)
 
     async def remove_cache(self, message_id: int):
         """转发成功或失败后，手动删除指定的 message_id"""
         str_message_id = str(message_id)
 
         async with self._file_lock:
-            try:
-                with open(self.cache_file, "r") as f:
-                    cache = json.load(f)
-
-            except (FileNotFoundError, json.JSONDecodeError):
+            if str_message_id not in self._entries:
                 return False
 
-            if str_message_id in cache:
-                del cache[str_message_id]
+            del self._entries[str_message_id]
+            self._due.pop(str_message_id, None)
+            self._append_journal({"op": "del", "id": str_message_id})
+            return True
 
-                with open(self.cache_file, "w") as f:
-                    json.dump(cache, f)
+    def next_maturity(self) -> float | None:
+        """返回下一条消息的成熟时间，没有排队消息时返回 None。"""
+        self._prune_heap_head()
+        return self._heap[0][0] if self._heap else None
 
-                return True
+    def pop_mature_messages(self) -> list:
+        """按成熟顺序弹出所有已成熟的消息ID。
+
+        弹出的消息仍保留在缓存中，直到调用 ``remove_cache``；处理中断时可用
+        ``requeue_message`` 放回调度堆。
+        """
+        current_time = time.time()
+        mature = []
+        while self._heap and self._heap[0][0] <= current_time:
+            due, message_id_str = heapq.heappop(self._heap)
+            if self._due.get(message_id_str) != due:
+                continue
+            del self._due[message_id_str]
+            if message_id_str in self._entries:
+                mature.append(message_id_str)
+        return mature
+
+    def requeue_message(self, message_id: int | str, delay: float = 0.0) -> bool:
+        """把仍在缓存中但已弹出的消息重新放回调度堆。"""
+        str_message_id = str(message_id)
+        if str_message_id not in self._entries or str_message_id in self._due:
             return False
+        self._schedule(str_message_id, time.time() + max(0.0, delay))
+        return True
+
+    async def wait_for_mature(self, timeout: float | None = None) -> bool:
+        """等待直到有消息成熟，返回是否有成熟消息。
+
+        没有排队消息时一直等待到 ``add_cache`` 唤醒；``timeout`` 为总等待上限。
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            self._wakeup.clear()
+            next_due = self.next_maturity()
+            current_time = time.time()
+            if next_due is not None and next_due <= current_time:
+                return True
+
+            wait_time = None if next_due is None else next_due - current_time
+            if deadline is not None:
+                remaining = deadline - current_time
+                if remaining <= 0:
+                    return False
+                wait_time = (
+                    remaining if wait_time is None else min(wait_time, remaining)
+                )
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait_time)
+            except asyncio.TimeoutError:
+                pass
+
+    def close(self):
+        """插件卸载时压缩日志并关闭文件句柄。"""
+        try:
+            self._compact()
+        except Exception as exc:
+            logger.error(f"[LocalCache][CLOSE] 压缩日志失败: {exc}")
+        if self._journal_fp is not None:
+            self._journal_fp.close()
+            self._journal_fp = None
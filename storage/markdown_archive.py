@@ -1,13 +1,26 @@
-import asyncio
-import json
 import os
 import re
-import urllib.request
 import uuid
+import asyncio
 from urllib.parse import urlsplit
 
 from astrbot.api import logger
 
+from ..core.downloader import Downloader, DownloadTooLarge
+from ..utils.message_utils import url_fingerprint
+from .archive_writer import ArchiveWriter
+from .blob_store import BlobStore
+from .processed_index import ProcessedIndex
+
+_BLOCK_SPLIT_RE = re.compile(r"(?<=\n---\n)(?=## )")
+_BLOCK_TIME_RE = re.compile(r"## (?:\[ignore\] )?(.*)")
+_ASSET_LINK_RE = re.compile(r"\]\((photos|files)/(.+)\)$", re.MULTILINE)
+
+
+def _block_time(block: str) -> str:
+    m = _BLOCK_TIME_RE.match(block)
+    return m.group(1) if m else ""
+
 
 class MarkdownArchive:
     def __init__(
@@ -15,19 +28,28 @@ class MarkdownArchive:
         root_dir: str,
         save_assets: bool = True,
         asset_max_mb: int = 20,
+        downloader: Downloader | None = None,
+        index_expire_days: int = 0,
+        writer: ArchiveWriter | None = None,
+        partition_by_group: bool = False,
     ):
         self.root_dir = os.path.abspath(root_dir)
         self.save_assets = save_assets
         self.asset_max_bytes = max(1, int(asset_max_mb)) * 1024 * 1024
+        self.downloader = downloader or Downloader()
+        self.writer = writer or ArchiveWriter()
+        self.partition_by_group = bool(partition_by_group)
 
-        self._lock = asyncio.Lock()
         self._index_dir = os.path.join(self.root_dir, "index")
-        self._index_file = os.path.join(self._index_dir, "message_ids.json")
 
         os.makedirs(self._index_dir, exist_ok=True)
-        if not os.path.exists(self._index_file):
-            with open(self._index_file, "w", encoding="utf-8") as f:
-                json.dump({}, f, ensure_ascii=False)
+        self.processed_index = ProcessedIndex(
+            self._index_dir, expire_days=index_expire_days
+        )
+        self.blob_store = BlobStore(
+            blob_dir=os.path.join(self.root_dir, "blobs"),
+            index_file=os.path.join(self._index_dir, "asset_fingerprints.jsonl"),
+        )
 
     @staticmethod
     def _safe_name(name: str, fallback: str) -> str:
@@ -36,35 +58,122 @@ class MarkdownArchive:
         text = text.replace("\n", " ").replace("\r", " ").strip()
         return text[:180] or fallback
 
+    def day_dir(self, day_str: str, group_id: str = "") -> str:
+        """某天的归档目录；按群分区时为 ``<group_id>/<day>``"""
+        if self.partition_by_group and group_id:
+            return os.path.join(
+                self.root_dir, self._safe_name(str(group_id), "unknown"), day_str
+            )
+        return os.path.join(self.root_dir, day_str)
+
     async def has_processed(self, message_key: str) -> bool:
-        async with self._lock:
-            try:
-                with open(self._index_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                return False
-            return str(message_key) in data
+        return str(message_key) in self.processed_index
 
     async def mark_processed(self, message_key: str, value: dict):
-        async with self._lock:
-            try:
-                with open(self._index_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = {}
-
-            data[str(message_key)] = value
-            with open(self._index_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-
-    async def append_entry(self, day_str: str, content: str) -> str:
-        async with self._lock:
-            day_dir = os.path.join(self.root_dir, day_str)
-            os.makedirs(day_dir, exist_ok=True)
-            target_file = os.path.join(day_dir, "messages.md")
-            with open(target_file, "a", encoding="utf-8") as f:
-                f.write(content)
-            return target_file
+        await self.processed_index.add(message_key, value)
+
+    async def close(self):
+        await self.writer.close()
+        self.processed_index.close()
+
+    async def append_entry(
+        self, day_str: str, content: str, group_id: str = ""
+    ) -> tuple[str, int]:
+        """追加一段归档内容，返回 (目标文件, 序号)，供 flush_entry 确认落盘"""
+        target_file = os.path.join(self.day_dir(day_str, group_id), "messages.md")
+        seq = await self.writer.write(day_str, target_file, content)
+        return target_file, seq
+
+    async def flush_entry(self, target_file: str, seq: int):
+        """确认 append_entry 写入的内容已落到文件, 登记去重索引前调用"""
+        await self.writer.flush_path(target_file, seq)
+
+    async def build_combined_day(self, day_str: str) -> str | None:
+        """按需把各群当天的归档合并为 ``combined/<day>.md`` 并返回路径。
+
+        未按群分区时当天只有一个文件，直接返回它；当天没有归档时返回 None。
+        """
+        await self.writer.flush()
+        if not self.partition_by_group:
+            target_file = os.path.join(self.day_dir(day_str), "messages.md")
+            return target_file if os.path.exists(target_file) else None
+        return await asyncio.to_thread(self._build_combined_day, day_str)
+
+    def _build_combined_day(self, day_str: str) -> str | None:
+        combined_dir = os.path.join(self.root_dir, "combined")
+        blocks = []
+        for group_dir in sorted(os.listdir(self.root_dir)):
+            source = os.path.join(self.root_dir, group_dir, day_str, "messages.md")
+            if group_dir in ("index", "blobs", "combined") or not os.path.isfile(
+                source
+            ):
+                continue
+            with open(source, "r", encoding="utf-8") as f:
+                content = f.read()
+            # 附件链接相对于各群的日期目录，改写为相对于 combined/
+            prefix = os.path.relpath(os.path.dirname(source), combined_dir)
+            prefix = prefix.replace("\\", "/")
+            content = _ASSET_LINK_RE.sub(rf"]({prefix}/\1/\2)", content)
+            blocks.extend(
+                block for block in _BLOCK_SPLIT_RE.split(content) if block.strip()
+            )
+        if not blocks:
+            return None
+
+        # 各群按时间交错排列；同一时间保持原顺序
+        blocks.sort(key=_block_time)
+        os.makedirs(combined_dir, exist_ok=True)
+        target_file = os.path.join(combined_dir, f"{day_str}.md")
+        tmp_file = f"{target_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write("".join(blocks))
+        os.replace(tmp_file, target_file)
+        logger.info(
+            f"[QQ2TG][Archive] 已生成合并视图: {target_file}, entries={len(blocks)}"
+        )
+        return target_file
+
+    async def _link_blob(
+        self,
+        day_str: str,
+        category: str,
+        blob_path: str,
+        preferred_name: str,
+        group_id: str = "",
+    ) -> str:
+        """在日期目录下放置指向 blob 的链接，同一天重复出现的附件共用一个链接"""
+        safe_name = self._safe_name(preferred_name, "asset")
+        target_name = f"{os.path.basename(blob_path)[:8]}_{safe_name}"
+        day_dir = self.day_dir(day_str, group_id)
+        target_path = os.path.join(day_dir, category, target_name)
+        await self.blob_store.link(blob_path, target_path)
+        rel = f"{category}/{target_name}".replace("\\", "/")
+        logger.info(
+            f"[QQ2TG][Archive] 附件已保存: {os.path.relpath(day_dir, self.root_dir)}/{rel}"
+        )
+        return rel
+
+    async def link_known_asset(
+        self,
+        day_str: str,
+        category: str,
+        fingerprints,
+        preferred_name: str,
+        group_id: str = "",
+    ) -> str | None:
+        """指纹命中已保存的附件时直接链接，无需下载"""
+        if not self.save_assets:
+            return None
+        blob_path = self.blob_store.lookup(fingerprints)
+        if blob_path is None:
+            return None
+        try:
+            await self.blob_store.remember(blob_path, fingerprints)
+            return await self._link_blob(
+                day_str, category, blob_path, preferred_name, group_id
+            )
+        except OSError:
+            return None
 
     async def save_url_asset(
         self,
@@ -72,58 +181,83 @@ class MarkdownArchive:
         category: str,
         url: str,
         preferred_name: str,
+        fingerprints=(),
+        group_id: str = "",
     ) -> str | None:
         if not self.save_assets:
             return None
         if not isinstance(url, str) or not url.startswith(("http://", "https://")):
             return None
 
-        safe_name = self._safe_name(preferred_name, f"asset_{uuid.uuid4().hex[:8]}")
+        fingerprints = (*fingerprints, url_fingerprint(url))
+        known = await self.link_known_asset(
+            day_str, category, fingerprints, preferred_name, group_id
+        )
+        if known:
+            return known
 
-        day_dir = os.path.join(self.root_dir, day_str)
-        asset_dir = os.path.join(day_dir, category)
-        os.makedirs(asset_dir, exist_ok=True)
-
-        target_name = f"{uuid.uuid4().hex[:8]}_{safe_name}"
-        target_path = os.path.join(asset_dir, target_name)
-
-        def _download() -> bool:
-            req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-            with (
-                urllib.request.urlopen(req, timeout=25) as resp,
-                open(target_path, "wb") as out,
-            ):
-                total = 0
-                while True:
-                    chunk = resp.read(1024 * 64)
-                    if not chunk:
-                        break
-                    total += len(chunk)
-                    if total > self.asset_max_bytes:
-                        raise ValueError("asset_too_large")
-                    out.write(chunk)
-            return os.path.exists(target_path) and os.path.getsize(target_path) > 0
+        tmp_dir = os.path.join(self.blob_store.blob_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
 
         try:
-            ok = await asyncio.to_thread(_download)
-            if not ok:
+            size = await self.downloader.download(url, tmp_path, self.asset_max_bytes)
+            if size <= 0:
                 return None
-            rel = f"{category}/{target_name}".replace("\\", "/")
-            logger.info(f"[QQ2TG][Archive] 附件已保存: {day_str}/{rel}")
-            return rel
-        except ValueError as exc:
-            if str(exc) == "asset_too_large":
-                logger.info(
-                    f"[QQ2TG][Archive] 附件超过上限({self.asset_max_bytes // (1024 * 1024)}MB): {preferred_name}"
-                )
+            blob_path = await self.blob_store.put(
+                tmp_path, preferred_name, fingerprints
+            )
+            return await self._link_blob(
+                day_str, category, blob_path, preferred_name, group_id
+            )
+        except DownloadTooLarge:
+            logger.info(
+                f"[QQ2TG][Archive] 附件超过上限({self.asset_max_bytes // (1024 * 1024)}MB): {preferred_name}"
+            )
             return None
         except Exception as exc:
             logger.warning(f"[QQ2TG][Archive] 下载附件失败: {exc}")
+            return None
+        finally:
             try:
-                if os.path.exists(target_path):
-                    os.remove(target_path)
-            except Exception:
+                os.remove(tmp_path)
+            except OSError:
                 pass
+
+    async def import_local_asset(
+        self,
+        day_str: str,
+        category: str,
+        src_path: str,
+        preferred_name: str,
+        fingerprints=(),
+        group_id: str = "",
+    ) -> str | None:
+        """把已下载的本地文件存入 blob 并链接到日期目录，源文件保持不变"""
+        if not self.save_assets or not src_path:
+            return None
+
+        try:
+            size = os.path.getsize(src_path)
+        except OSError:
+            return None
+        if size <= 0:
+            return None
+        if size > self.asset_max_bytes:
+            logger.info(
+                f"[QQ2TG][Archive] 附件超过上限({self.asset_max_bytes // (1024 * 1024)}MB): {preferred_name}"
+            )
+            return None
+
+        try:
+            blob_path = await self.blob_store.put(
+                src_path, preferred_name, fingerprints
+            )
+            return await self._link_blob(
+                day_str, category, blob_path, preferred_name, group_id
+            )
+        except Exception as exc:
+            logger.warning(f"[QQ2TG][Archive] 导入附件失败: {exc}")
             return None
 
     @staticmethod
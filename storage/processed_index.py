@@ -0,0 +1,133 @@
+# processed_index.py
+
+import os
+import json
+import time
+import asyncio
+from astrbot.api import logger
+
+
+class ProcessedIndex:
+    """归档去重索引。
+
+    内存字典保存已归档消息，磁盘上由快照 ``message_ids.json`` 与追加写日志
+    ``message_ids.journal`` 共同持久化：每次登记只追加一行，日志累计到
+    ``compact_threshold`` 条后在后台线程合并回快照。旧版本整份重写的
+    ``message_ids.json`` 直接作为快照读取，无需手动迁移。
+    ``expire_days`` 大于 0 时，压缩时丢弃超过该天数的记录。
+    """
+
+    def __init__(
+        self, index_dir: str, expire_days: int = 0, compact_threshold: int = 1000
+    ):
+        self.snapshot_file = os.path.join(index_dir, "message_ids.json")
+        self.journal_file = os.path.join(index_dir, "message_ids.journal")
+        self.expire_seconds = max(0, int(expire_days)) * 86400
+        self.compact_threshold = max(1, int(compact_threshold))
+
+        self._lock = asyncio.Lock()
+        self._entries: dict[str, dict] = {}
+        self._journal_fp = None
+        self._journal_records = 0
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if isinstance(snapshot, dict):
+                self._entries.update(
+                    (str(key), value if isinstance(value, dict) else {})
+                    for key, value in snapshot.items()
+                )
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError:
+            logger.error("[ProcessedIndex][LOAD] 去重索引快照格式错误，已忽略。")
+
+        replayed = 0
+        try:
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning("[ProcessedIndex][LOAD] 跳过损坏的日志记录。")
+                        continue
+                    if isinstance(record, dict) and record.get("k"):
+                        value = record.get("v")
+                        self._entries[str(record["k"])] = (
+                            value if isinstance(value, dict) else {}
+                        )
+                        replayed += 1
+        except FileNotFoundError:
+            pass
+
+        loaded = len(self._entries)
+        if replayed:
+            logger.info(f"[ProcessedIndex][LOAD] 已重放日志 {replayed} 条")
+        # 重放后总要先裁剪过期记录，再决定是否需要写回快照
+        expired = loaded - len(self._live_entries())
+        if replayed or expired:
+            self._write_snapshot(self._entries)
+        self._journal_fp = open(self.journal_file, "w", encoding="utf-8")
+
+    def _live_entries(self) -> dict:
+        """按过期设置裁剪内存记录并返回"""
+        if self.expire_seconds:
+            cutoff = time.time() - self.expire_seconds
+            self._entries = {
+                key: value
+                for key, value in self._entries.items()
+                if float(value.get("ts", cutoff) or cutoff) >= cutoff
+            }
+        return self._entries
+
+    def _write_snapshot(self, entries: dict):
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, self.snapshot_file)
+
+    def _compact_sync(self, entries: dict):
+        self._write_snapshot(entries)
+        if self._journal_fp is not None:
+            self._journal_fp.close()
+        self._journal_fp = open(self.journal_file, "w", encoding="utf-8")
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def add(self, key, value: dict):
+        async with self._lock:
+            key = str(key)
+            self._entries[key] = value
+            if self._journal_fp is None:
+                self._journal_fp = open(self.journal_file, "a", encoding="utf-8")
+            self._journal_fp.write(
+                json.dumps({"k": key, "v": value}, ensure_ascii=False) + "\n"
+            )
+            self._journal_fp.flush()
+            self._journal_records += 1
+            if self._journal_records >= self.compact_threshold:
+                self._journal_records = 0
+                entries = dict(self._live_entries())
+                await asyncio.to_thread(self._compact_sync, entries)
+
+    def close(self):
+        """插件卸载时压缩日志并关闭文件句柄。"""
+        try:
+            self._compact_sync(dict(self._live_entries()))
+        except Exception as exc:
+            logger.error(f"[ProcessedIndex][CLOSE] 压缩日志失败: {exc}")
+        if self._journal_fp is not None:
+            self._journal_fp.close()
+            self._journal_fp = None
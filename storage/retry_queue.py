@@ -0,0 +1,428 @@
+# retry_queue.py
+
+from ..config import TEMP_DIR
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from collections import deque
+from datetime import timedelta
+from astrbot.api import logger
+
+
+_RETRY_AFTER_PATTERNS = (
+    re.compile(r"retry[ _-]?after\D{0,8}?(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"try again in (\d+(?:\.\d+)?)", re.IGNORECASE),
+)
+
+
+def extract_retry_after(exc) -> float | None:
+    """从发送异常中提取平台给出的重试等待秒数，取不到时返回 None。
+
+    兼容 telegram ``RetryAfter.retry_after`` (int 或 timedelta)、
+    discord ``RateLimited.retry_after``、HTTP 响应头 ``Retry-After`` 以及错误文本。
+    """
+    if exc is None:
+        return None
+
+    value = getattr(exc, "retry_after", None)
+    if isinstance(value, timedelta):
+        return max(0.0, value.total_seconds())
+    if isinstance(value, (int, float)):
+        return max(0.0, float(value))
+
+    for holder in (exc, getattr(exc, "response", None)):
+        headers = getattr(holder, "headers", None)
+        if headers is None:
+            continue
+        try:
+            header_value = headers.get("Retry-After") or headers.get("retry-after")
+            if header_value is not None:
+                return max(0.0, float(header_value))
+        except (TypeError, ValueError, AttributeError):
+            pass
+
+    text = str(exc)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            return float(m.group(1))
+    return None
+
+
+class DeliveryHeld(Exception):
+    """send_func 暂时无法发送 (如熔断探测名额已被占用) 时抛出，不计入重试次数。"""
+
+    def __init__(self, message: str = "", retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeliveryRetryQueue:
+    """转发失败后的持久化重试队列。
+
+    待重试条目由快照 ``delivery_retry.json`` 与追加写日志 ``delivery_retry.journal``
+    持久化：登记、更新、移除各追加一行日志，日志累计到 ``compact_threshold`` 条后
+    合并回快照。附件复制到 ``retry_files/``。
+    超过最大次数、或目标积压超过 ``max_pending_per_target`` 时最旧的条目追加写入
+    ``delivery_dead_letter.jsonl``，其附件移到 ``dead_letter_files/`` 保留，便于人工补发。
+    每个目标一条 FIFO 队列，只有队首参与调度，保证目标内顺序；
+    不同目标各自独立退避、并发重试，互不阻塞。
+    """
+
+    def __init__(
+        self,
+        send_func,
+        hold_func=None,
+        max_attempts: int = 5,
+        base_delay: float = 5.0,
+        max_delay: float = 600.0,
+        max_pending_per_target: int = 500,
+        compact_threshold: int = 200,
+    ):
+        self.queue_file = os.path.join(TEMP_DIR, "delivery_retry.json")
+        self.journal_file = os.path.join(TEMP_DIR, "delivery_retry.journal")
+        self.dead_letter_file = os.path.join(TEMP_DIR, "delivery_dead_letter.jsonl")
+        self.files_dir = os.path.join(TEMP_DIR, "retry_files")
+        self.dead_letter_files_dir = os.path.join(TEMP_DIR, "dead_letter_files")
+        self.send_func = send_func
+        # hold_func(target) 返回目标暂不可发送的秒数(如熔断中)，等待期间不计入重试次数
+        self.hold_func = hold_func
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.1, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+        self.max_pending_per_target = max(1, int(max_pending_per_target))
+        self.compact_threshold = max(1, int(compact_threshold))
+
+        self._journal_fp = None
+        self._journal_records = 0
+        self._items: dict[str, dict] = {}
+        self._target_queues: dict[str, deque] = {}
+        self._inflight_targets: set[str] = set()
+        self._send_tasks: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """读取快照并重放日志，随后立即压缩，保证启动后日志为空。"""
+        data = []
+        try:
+            with open(self.queue_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError:
+            logger.error("[RetryQueue][LOAD] 重试队列文件格式错误，已忽略。")
+
+        items = {
+            item["id"]: item
+            for item in (data if isinstance(data, list) else [])
+            if isinstance(item, dict) and item.get("id") and item.get("target")
+        }
+        try:
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程异常退出时最后一行可能只写了一半
+                        logger.warning("[RetryQueue][LOAD] 跳过损坏的日志记录。")
+                        continue
+                    self._apply_record(items, record)
+        except FileNotFoundError:
+            pass
+
+        for item in sorted(
+            items.values(), key=lambda item: float(item.get("created_at", 0))
+        ):
+            self._items[item["id"]] = item
+            self._target_queues.setdefault(item["target"], deque()).append(item["id"])
+        self._compact()
+        if self._items:
+            logger.info(f"[RetryQueue][LOAD] 恢复待重试转发 {len(self._items)} 条")
+
+    @staticmethod
+    def _apply_record(items: dict, record):
+        if not isinstance(record, dict):
+            return
+        op = record.get("op")
+        if op == "put":
+            item = record.get("item")
+            if isinstance(item, dict) and item.get("id") and item.get("target"):
+                items[item["id"]] = item
+        elif op == "update":
+            item = items.get(record.get("id"))
+            if item is not None and isinstance(record.get("fields"), dict):
+                item.update(record["fields"])
+        elif op == "del":
+            items.pop(record.get("id"), None)
+
+    def _append_journal(self, record: dict):
+        if self._journal_fp is None:
+            self._journal_fp = open(self.journal_file, "a", encoding="utf-8")
+        self._journal_fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal_fp.flush()
+        self._journal_records += 1
+        if self._journal_records >= self.compact_threshold:
+            self._compact()
+
+    def _journal_update(self, item: dict, *keys: str):
+        self._append_journal(
+            {"op": "update", "id": item["id"], "fields": {k: item[k] for k in keys}}
+        )
+
+    def _compact(self):
+        """把内存状态整体写入快照并清空日志。"""
+        tmp_file = f"{self.queue_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(list(self._items.values()), f, ensure_ascii=False)
+        os.replace(tmp_file, self.queue_file)
+
+        if self._journal_fp is not None:
+            self._journal_fp.close()
+        self._journal_fp = open(self.journal_file, "w", encoding="utf-8")
+        self._journal_records = 0
+
+    def _backoff(self, attempts: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        return min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+
+    def _preserve_files(self, item_id: str, chain_data: list) -> list:
+        """把链中引用的本地文件复制到重试目录，避免被转发流程的临时清理删掉。"""
+        preserved = []
+        for comp in chain_data:
+            path = comp.get("path") if isinstance(comp, dict) else None
+            if not path or not os.path.exists(path):
+                preserved.append(comp)
+                continue
+            target_path = os.path.join(
+                self.files_dir, f"{item_id}_{os.path.basename(path)}"
+            )
+            try:
+                os.link(path, target_path)
+            except OSError:
+                shutil.copyfile(path, target_path)
+            preserved.append({**comp, "path": target_path})
+        return preserved
+
+    def _release_files(self, item: dict):
+        for comp in item.get("chain", []):
+            path = comp.get("path") if isinstance(comp, dict) else None
+            if path and path.startswith((self.files_dir, self.dead_letter_files_dir)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _move_to_dead_letter_files(self, item: dict):
+        """把条目的附件从重试目录移到死信目录，消息链中的路径随之更新。"""
+        chain = item.get("chain", [])
+        for index, comp in enumerate(chain):
+            path = comp.get("path") if isinstance(comp, dict) else None
+            if (
+                not path
+                or not path.startswith(self.files_dir)
+                or not os.path.exists(path)
+            ):
+                continue
+            os.makedirs(self.dead_letter_files_dir, exist_ok=True)
+            target_path = os.path.join(
+                self.dead_letter_files_dir, os.path.basename(path)
+            )
+            os.replace(path, target_path)
+            chain[index] = {**comp, "path": target_path}
+
+    def pending_count(self, target: str | None = None) -> int:
+        if target is None:
+            return len(self._items)
+        return len(self._target_queues.get(target, ()))
+
+    def _head_item(self, target: str) -> dict | None:
+        queue = self._target_queues.get(target)
+        return self._items.get(queue[0]) if queue else None
+
+    def _pop_head(self, target: str):
+        queue = self._target_queues.get(target)
+        if queue:
+            queue.popleft()
+            if not queue:
+                del self._target_queues[target]
+                return
+            # 前一条处理完后，下一条立即可发
+            self._items[queue[0]]["next_at"] = time.time()
+
+    def _dead_letter(self, item: dict, reason: str) -> bool:
+        """写入死信并移出队列；写入失败时条目留在队列中，返回 False。"""
+        # 先写死信并保留附件，写入失败时不丢消息
+        try:
+            self._move_to_dead_letter_files(item)
+            with open(self.dead_letter_file, "a", encoding="utf-8") as f:
+                record = {**item, "dead_at": time.time(), "dead_reason": reason}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as exc:
+            self._journal_update(item, "chain")
+            logger.error(
+                f"[RetryQueue] 写入死信失败，保留在重试队列: msg={item['msg_id']} -> {item['target']}, error={exc}"
+            )
+            return False
+
+        target = item["target"]
+        queue = self._target_queues.get(target)
+        if queue and queue[0] == item["id"]:
+            self._pop_head(target)
+        elif queue:
+            queue.remove(item["id"])
+        self._items.pop(item["id"], None)
+        self._append_journal({"op": "del", "id": item["id"]})
+        return True
+
+    def _enforce_cap(self, target: str):
+        """目标积压超过上限时把最旧的条目 (正在发送的队首除外) 写入死信。"""
+        queue = self._target_queues.get(target)
+        while queue and len(queue) > self.max_pending_per_target:
+            skip = 1 if target in self._inflight_targets else 0
+            if len(queue) <= skip:
+                return
+            item = self._items[queue[skip]]
+            if not self._dead_letter(item, "积压超过上限"):
+                return
+            logger.error(
+                f"[RetryQueue] 目标积压超过 {self.max_pending_per_target} 条，最旧的已写入死信: msg={item['msg_id']} -> {target}"
+            )
+
+    async def enqueue(
+        self,
+        msg_id,
+        target: str,
+        chain_data: list,
+        error: str = "",
+        retry_after: float | None = None,
+        attempted: bool = True,
+    ):
+        """登记一次失败的投递, chain_data 为可 JSON 序列化的消息链
+
+        attempted 为 False 表示未实际发送就直接排队 (如目标熔断中)，不计入尝试次数。
+        """
+        item_id = uuid.uuid4().hex
+        chain_data = await asyncio.to_thread(self._preserve_files, item_id, chain_data)
+        item = {
+            "id": item_id,
+            "msg_id": str(msg_id),
+            "target": target,
+            "chain": chain_data,
+            "attempts": 1 if attempted else 0,
+            "created_at": time.time(),
+            "next_at": time.time() + self._backoff(1, retry_after),
+            "last_error": str(error)[:500],
+        }
+        self._items[item_id] = item
+        self._target_queues.setdefault(target, deque()).append(item_id)
+        self._append_journal({"op": "put", "item": item})
+        self._enforce_cap(target)
+        self._wakeup.set()
+        logger.info(
+            f"[RetryQueue] 已加入重试: msg={msg_id} -> {target}, {item['next_at'] - time.time():.1f}s 后重试"
+        )
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._send_tasks)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._send_tasks.clear()
+        self._compact()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            next_due = None
+            for target in list(self._target_queues):
+                if target in self._inflight_targets:
+                    continue
+                head = self._head_item(target)
+                if head is None:
+                    continue
+                if head["next_at"] <= now and self.hold_func is not None:
+                    hold = self.hold_func(target)
+                    if hold > 0:
+                        head["next_at"] = now + hold
+                        self._journal_update(head, "next_at")
+                if head["next_at"] > now:
+                    if next_due is None or head["next_at"] < next_due:
+                        next_due = head["next_at"]
+                    continue
+                self._inflight_targets.add(target)
+                task = asyncio.create_task(self._attempt(head))
+                self._send_tasks.add(task)
+                task.add_done_callback(self._send_tasks.discard)
+
+            wait_time = None if next_due is None else max(0.05, next_due - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait_time)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _attempt(self, item: dict):
+        target = item["target"]
+        try:
+            await self.send_func(target, item["chain"])
+        except asyncio.CancelledError:
+            raise
+        except DeliveryHeld as exc:
+            # 未实际发送，与 hold_func 一样只推迟，不计入尝试次数
+            item["next_at"] = time.time() + (
+                exc.retry_after if exc.retry_after else self.base_delay
+            )
+            self._journal_update(item, "next_at")
+        except Exception as exc:
+            self._on_failure(item, exc)
+        else:
+            self._items.pop(item["id"], None)
+            self._pop_head(target)
+            self._release_files(item)
+            self._append_journal({"op": "del", "id": item["id"]})
+            logger.info(
+                f"[RetryQueue] 重试成功: msg={item['msg_id']} -> {target}, attempts={item['attempts'] + 1}"
+            )
+        finally:
+            self._inflight_targets.discard(target)
+            self._wakeup.set()
+
+    def _on_failure(self, item: dict, exc: Exception):
+        item["attempts"] += 1
+        item["last_error"] = str(exc)[:500]
+        if item["attempts"] >= self.max_attempts:
+            if not self._dead_letter(item, "重试次数耗尽"):
+                item["next_at"] = time.time() + self.max_delay
+                self._journal_update(item, "attempts", "last_error", "next_at")
+                return
+            logger.error(
+                f"[RetryQueue] 重试次数耗尽，已写入死信: msg={item['msg_id']} -> {item['target']}, error={exc}"
+            )
+            return
+
+        delay = self._backoff(item["attempts"], extract_retry_after(exc))
+        item["next_at"] = time.time() + delay
+        self._journal_update(item, "attempts", "last_error", "next_at")
+        logger.warning(
+            f"[RetryQueue] 重试失败: msg={item['msg_id']} -> {item['target']}, attempts={item['attempts']}, {delay:.1f}s 后再试, error={exc}"
+        )
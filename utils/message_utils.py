@@ -0,0 +1,315 @@
+# 消息处理工具
+import html
+import json
+import re
+from urllib.parse import parse_qsl, urlsplit
+
+
+class ExpandBudget:
+    """合并转发展开预算, 限制单条消息展开出的节点数与内容字节数; 0 表示不限制"""
+
+    def __init__(self, max_nodes: int = 0, max_bytes: int = 0):
+        self.max_nodes = max(0, int(max_nodes))
+        self.max_bytes = max(0, int(max_bytes))
+        self.nodes = 0
+        self.bytes = 0
+        self.truncated = False
+
+    def consume(self, msg_content) -> bool:
+        """登记一个即将输出的节点, 超出预算时返回 False 并标记截断"""
+        if self.truncated:
+            return False
+        size = len(json.dumps(msg_content, ensure_ascii=False, default=str).encode())
+        if (self.max_nodes and self.nodes + 1 > self.max_nodes) or (
+            self.max_bytes and self.bytes + size > self.max_bytes
+        ):
+            self.truncated = True
+            return False
+        self.nodes += 1
+        self.bytes += size
+        return True
+
+
+_PLACEHOLDERS = {
+    "image": "[图片]",
+    "face": "[表情]",
+    "reply": "[回复]",
+    "record": "[语音]",
+    "video": "[视频]",
+    "forward": "[合并转发]",
+}
+
+# 每次获取都会变化的 URL 参数, 不参与附件指纹
+_VOLATILE_QUERY_KEYS = frozenset({"rkey", "fname", "term", "is_origin"})
+_HEX_NAME_RE = re.compile(r"^[0-9a-fA-F]{16,}(\.\w+)?$")
+
+_CARD_FIELD_KEYS = (
+    ("title", frozenset({"title", "prompt", "source", "name"})),
+    ("desc", frozenset({"desc", "description", "summary", "text", "content"})),
+    (
+        "url",
+        frozenset(
+            {"url", "jumpurl", "qqdocurl", "newsurl", "docurl", "target", "link"}
+        ),
+    ),
+)
+
+
+class Segment:
+    """消息段的中间表示, 每个 QQ 消息段只解析一次, 各输出通道共用
+
+    kind 为 text/at/image/file/json/forward/raw 或原始段类型;
+    text 为该段的文本或占位文本; url 对图片是直链, 对文件在解析后缓存;
+    name 为文件名; size 为消息段给出的文件大小 (未知为 None);
+    forward_id 为合并转发 id; raw 为原始消息段。
+    """
+
+    __slots__ = ("kind", "text", "url", "name", "size", "forward_id", "raw")
+
+    def __init__(
+        self, kind, text="", url=None, name="", size=None, forward_id="", raw=None
+    ):
+        self.kind = kind
+        self.text = text
+        self.url = url
+        self.name = name
+        self.size = size
+        self.forward_id = forward_id
+        self.raw = raw
+
+    @property
+    def data(self) -> dict:
+        data = self.raw.get("data") if isinstance(self.raw, dict) else None
+        return data if isinstance(data, dict) else {}
+
+
+def is_http_url(value) -> bool:
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
+
+
+def pick_file_name(file_data: dict) -> str:
+    raw_name = file_data.get("name") or ""
+    if isinstance(raw_name, str):
+        cleaned = raw_name.strip()
+        if cleaned and cleaned not in {"拓展名", "扩展名", "unknown", "file.bin"}:
+            return cleaned
+
+    raw_file = file_data.get("file") or ""
+    if isinstance(raw_file, str):
+        cleaned = raw_file.strip()
+        if cleaned and not is_http_url(cleaned):
+            return cleaned
+
+    return "unknown_file"
+
+
+def extract_file_size(file_data: dict) -> int | None:
+    """OneBot 文件段中的文件大小 (NapCat 为 file_size, 部分实现为 size)"""
+    for key in ("file_size", "size"):
+        try:
+            size = int(file_data.get(key) or 0)
+        except (TypeError, ValueError):
+            continue
+        if size > 0:
+            return size
+    return None
+
+
+def extract_forward_id(seg_data: dict) -> str:
+    for key in ("id", "resid", "forward_id"):
+        value = seg_data.get(key)
+        if value is None:
+            continue
+        text = str(value).strip()
+        if text:
+            return text
+    return ""
+
+
+def extract_card_fields(obj) -> dict:
+    """一次遍历卡片 JSON, 取出 title/desc/url 各自第一个非空字段
+
+    查找顺序与逐字段深度优先查找一致: 先看当前层的键, 再进入子节点。
+    """
+    found = {}
+
+    def _walk(node) -> bool:
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if not isinstance(value, (str, int, float)):
+                    continue
+                text = str(value).strip()
+                if not text:
+                    continue
+                key = str(key).lower()
+                for field, keys in _CARD_FIELD_KEYS:
+                    if field not in found and key in keys:
+                        found[field] = text
+            if len(found) == len(_CARD_FIELD_KEYS):
+                return True
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            return False
+
+        for child in children:
+            if isinstance(child, (dict, list)) and _walk(child):
+                return True
+        return False
+
+    _walk(obj)
+    return found
+
+
+def parse_json_card(data: dict) -> str:
+    """把 json 消息段 (小程序/分享卡片) 转为一行摘要"""
+    raw = data.get("data")
+    obj = None
+
+    if isinstance(raw, dict):
+        obj = raw
+    elif isinstance(raw, str):
+        payload = raw.strip()
+        if payload:
+            for candidate in (payload, html.unescape(payload)):
+                try:
+                    parsed = json.loads(candidate)
+                    if isinstance(parsed, str):
+                        parsed = json.loads(parsed)
+                    if isinstance(parsed, (dict, list)):
+                        obj = parsed
+                        break
+                except Exception:
+                    continue
+
+    if obj is None:
+        preview = str(raw).strip() if raw is not None else ""
+        if len(preview) > 160:
+            preview = preview[:157] + "..."
+        return f"[JSON卡片] {preview}" if preview else "[JSON卡片]"
+
+    fields = extract_card_fields(obj)
+    title = fields.get("title", "")
+    desc = fields.get("desc", "")
+    url = fields.get("url", "")
+
+    parts = ["[JSON卡片]"]
+    if title:
+        parts.append(f"标题: {title}")
+    if desc and desc != title:
+        parts.append(f"摘要: {desc}")
+    if url:
+        parts.append(f"链接: {url}")
+
+    return " | ".join(parts)
+
+
+def parse_segment(seg) -> Segment:
+    if not isinstance(seg, dict):
+        return Segment("raw", text=str(seg), raw=seg)
+
+    seg_type = seg.get("type")
+    data = seg.get("data")
+    if not isinstance(data, dict):
+        data = {}
+
+    if seg_type == "text":
+        text = data.get("text", "")
+        return Segment("text", text=text if isinstance(text, str) else "", raw=seg)
+    if seg_type == "at":
+        return Segment("at", text=f"@{data.get('qq', 'unknown')}", raw=seg)
+    if seg_type == "image":
+        image_url = data.get("url") or data.get("file")
+        return Segment(
+            "image",
+            text=_PLACEHOLDERS["image"],
+            url=image_url if is_http_url(image_url) else "",
+            raw=seg,
+        )
+    if seg_type == "file":
+        file_name = pick_file_name(data)
+        return Segment(
+            "file",
+            text=f"[文件:{file_name}]",
+            name=file_name,
+            size=extract_file_size(data),
+            raw=seg,
+        )
+    if seg_type == "json":
+        return Segment("json", text=parse_json_card(data), raw=seg)
+    if seg_type == "forward":
+        return Segment(
+            "forward",
+            text=_PLACEHOLDERS["forward"],
+            forward_id=extract_forward_id(data),
+            raw=seg,
+        )
+    if seg_type in _PLACEHOLDERS:
+        return Segment(seg_type, text=_PLACEHOLDERS[seg_type], raw=seg)
+    return Segment(seg_type or "unknown", text=f"[{seg_type or 'unknown'}]", raw=seg)
+
+
+def parse_segments(msg_segments) -> list[Segment]:
+    """解析 OneBot 消息段列表; 非列表内容按纯文本处理"""
+    if not isinstance(msg_segments, list):
+        msg_segments = [{"type": "text", "data": {"text": str(msg_segments)}}]
+    return [parse_segment(seg) for seg in msg_segments]
+
+
+def render_text(segments: list[Segment]) -> str:
+    """渲染为单行预览文本"""
+    text = " ".join(seg.text for seg in segments if seg.text).strip()
+    return text or "[空消息]"
+
+
+def plain_text(segments: list[Segment]) -> str:
+    """消息全部由文本段组成时返回拼接后的文本, 否则返回空串"""
+    if not segments or any(seg.kind != "text" for seg in segments):
+        return ""
+    return "".join(seg.text for seg in segments)
+
+
+def text_content(segments: list[Segment]) -> str:
+    """拼接所有文本段的内容, 忽略回复、@、表情、图片等非文本段"""
+    return " ".join(
+        seg.text.strip() for seg in segments if seg.kind == "text" and seg.text.strip()
+    )
+
+
+def url_fingerprint(url: str) -> str:
+    """去掉签名等易变参数后的 URL 指纹, 同一附件多次获取得到相同结果"""
+    if not is_http_url(url):
+        return ""
+    try:
+        parsed = urlsplit(url)
+    except ValueError:
+        return ""
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in _VOLATILE_QUERY_KEYS
+    )
+    query_text = "&".join(f"{key}={value}" for key, value in query)
+    return f"url:{parsed.netloc.lower()}{parsed.path}?{query_text}"
+
+
+def asset_fingerprints(seg: Segment) -> tuple:
+    """图片/文件段可用于识别已归档附件的指纹: QQ 文件 id、图片文件名 (内容 md5) 与 URL"""
+    data = seg.data
+    fingerprints = []
+    if seg.kind == "image":
+        for key in ("file_unique", "file"):
+            value = data.get(key)
+            # QQ 图片文件名是内容的 md5, 其他形式的名字不可靠, 不作为指纹
+            if isinstance(value, str) and _HEX_NAME_RE.match(value.strip()):
+                fingerprints.append(f"qqimg:{value.strip().lower()}")
+    elif seg.kind == "file":
+        for key in ("file_id", "file_unique", "fid"):
+            value = data.get(key)
+            if value:
+                fingerprints.append(f"qqfile:{str(value).strip()}")
+    url_fp = url_fingerprint(seg.url) if seg.url else ""
+    if url_fp:
+        fingerprints.append(url_fp)
+    return tuple(fingerprints)